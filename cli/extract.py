@@ -76,9 +76,15 @@ app = typer.Typer()
 def extract(
     input_path: Path = typer.Argument(..., help="Path to the input corpus file"),
     output_path: Path = typer.Argument(..., help="Path to save the extractions"),
-    batch_size: int = typer.Option(4, "--batch-size", "-b", help="Batch size for processing"),
+    batch_size: int = typer.Option(8, "--batch-size", "-b", help="Chunks per generate() call"),
+    max_batch_tokens: Optional[int] = typer.Option(None, "--max-batch-tokens", help="Token budget per batch (prompt + generation); overrides --batch-size"),
     max_chunks: Optional[int] = typer.Option(None, "--max-chunks", "-m", help="Maximum number of chunks to process"),
     debug: bool = typer.Option(False, "--debug", "-d", help="Enable debug output"),
+    no_cache: bool = typer.Option(False, "--no-cache", help="Bypass the on-disk extraction cache"),
+    constrained: bool = typer.Option(False, "--constrained", help="Constrain output to the extraction JSON schema (requires outlines<1.0: the constrained extra)"),
+    no_prefilter: bool = typer.Option(False, "--no-prefilter", help="Send every chunk to the LLM, even without pathogen/BSL keywords"),
+    backend: str = typer.Option("transformers", "--backend", help="Generation backend: transformers or vllm (requires vllm<0.11: the vllm extra)"),
+    vllm_quantization: Optional[str] = typer.Option(None, "--vllm-quantization", help="vLLM quantization method, e.g. fp8 or awq (vllm backend only)"),
 ) -> None:
     """Extract BSL lab information from a corpus using a local LLM."""
     start_time = time.time()
@@ -92,10 +98,24 @@ def extract(
     logger.info(f"Starting extraction at {time.ctime()}")
     logger.info(f"Input file: {input_path}")
     logger.info(f"Output file: {output_path}")
-    logger.info(f"Batch size: {batch_size}")
+    if max_batch_tokens:
+        logger.info(f"Max batch tokens: {max_batch_tokens}")
+    else:
+        logger.info(f"Batch size: {batch_size}")
     logger.info(f"Extraction method: LLM-based with prompt from config/prompt.md")
     if max_chunks:
         logger.info(f"Max chunks: {max_chunks}")
+    if no_cache:
+        logger.info("Extraction cache: disabled")
+    if constrained:
+        logger.info("Decoding: JSON-schema constrained")
+    if no_prefilter:
+        logger.info("Keyword prefilter: disabled")
+    if backend not in ("transformers", "vllm"):
+        raise typer.BadParameter("must be 'transformers' or 'vllm'", param_hint="--backend")
+    logger.info(f"Backend: {backend}")
+    if vllm_quantization:
+        logger.info(f"vLLM quantization: {vllm_quantization}")
     
     try:
         process_corpus(
@@ -103,7 +123,13 @@ def extract(
             output_path=output_path,
             batch_size=batch_size,
             max_chunks=max_chunks,
-            debug=debug
+            debug=debug,
+            use_cache=not no_cache,
+            max_batch_tokens=max_batch_tokens,
+            constrained=constrained,
+            prefilter=not no_prefilter,
+            backend=backend,
+            vllm_quantization=vllm_quantization
         )
         elapsed = time.time() - start_time
         logger.info(f"\nExtraction completed successfully in {elapsed:.2f} seconds")
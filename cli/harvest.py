@@ -7,7 +7,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
 import typer
-from bslmap.cfg import Settings
+from bslmap.cfg import get_settings
 from bslmap.harvest_pubmed import search_pubmed
 from bslmap.harvest_eupmc import links_for_pmids
 from bslmap.io_utils import write_jsonl, read_jsonl
@@ -24,7 +24,7 @@ def pubmed(institutions: Path, keywords: Path, out: Path) -> None:
         keywords: Path to keywords file
         out: Output path for harvested data
     """
-    cfg = Settings()
+    cfg = get_settings()
     insts = [x.strip() for x in institutions.read_text().splitlines() if x.strip()]
     keys = [x.strip() for x in keywords.read_text().splitlines() if x.strip()]
     records = search_pubmed(insts, keys, cfg)
@@ -33,12 +33,17 @@ def pubmed(institutions: Path, keywords: Path, out: Path) -> None:
 
 
 @app.command()
-def eupmc(pmids_from: Path, out: Path) -> None:
+def eupmc(
+    pmids_from: Path,
+    out: Path,
+    no_cache: bool = typer.Option(False, "--no-cache", help="Bypass the on-disk Europe PMC links cache"),
+) -> None:
     """Harvest EUPMC data from PMIDs.
     
     Args:
         pmids_from: Path to file containing PMIDs
         out: Output path for harvested data
+        no_cache: Re-query every PMID instead of reusing cached links
     """
     print(f"\n{'='*60}\nEUROPE PMC HARVESTER - DEBUG MODE\n{'='*60}")
     print(f"Input file: {pmids_from.absolute()}")
@@ -46,7 +51,7 @@ def eupmc(pmids_from: Path, out: Path) -> None:
     
     # Load settings
     try:
-        cfg = Settings()
+        cfg = get_settings()
         print("✓ Settings loaded successfully")
     except Exception as e:
         print(f"❌ Error loading settings: {e}")
@@ -80,7 +85,7 @@ def eupmc(pmids_from: Path, out: Path) -> None:
     # Process PMIDs
     try:
         print(f"\nStarting Europe PMC harvest for {len(pmids)} PMIDs...")
-        links = links_for_pmids(pmids, cfg)
+        links = links_for_pmids(pmids, cfg, use_cache=not no_cache)
         print(f"\n✓ Harvest complete. Found {len(links)} links")
         
         # Save results
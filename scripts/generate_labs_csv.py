@@ -3,31 +3,76 @@
 Script to generate labs.csv from institutions.txt with geocoding.
 """
 import csv
+import hashlib
+import json
 import sys
+import time
 from pathlib import Path
 from typing import Dict, Optional, Tuple
 import requests
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
+from urllib3.util.retry import Retry
 
-def geocode_institution(name: str, country: str = '') -> Optional[Tuple[float, float, str, str]]:
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+USER_AGENT = 'BSLMap/1.0 (https://github.com/yourusername/bslmap; your.email@example.com)'
+# Nominatim usage policy: at most one request per second
+MIN_REQUEST_INTERVAL = 1.0
+
+def make_session() -> requests.Session:
+    """Create a session that reuses its connection and retries transient failures."""
+    session = requests.Session()
+    retry = Retry(
+        total=3,
+        backoff_factor=1.0,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET",),
+    )
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry))
+    session.headers.update({'User-Agent': USER_AGENT})
+    return session
+
+def _cache_key(name: str, country: str = '') -> str:
+    return hashlib.sha256(f"{name}|{country}".encode("utf-8")).hexdigest()
+
+def load_geocode_cache(cache_path: Path) -> Dict[str, list]:
+    """Load previously resolved geocodes, keyed by sha256(name|country)."""
+    if not cache_path.exists():
+        return {}
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Warning: ignoring unreadable geocode cache {cache_path}: {e}", file=sys.stderr)
+        return {}
+
+def save_geocode_cache(cache_path: Path, cache: Dict[str, list]) -> None:
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix(cache_path.suffix + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f)
+    tmp_path.replace(cache_path)
+
+def geocode_institution(
+    name: str,
+    country: str = '',
+    session: Optional[requests.Session] = None,
+) -> Optional[Tuple[float, float, str, str]]:
     """Geocode an institution name to get its coordinates and location details."""
-    base_url = "https://nominatim.openstreetmap.org/search"
     query = f"{name}, {country}" if country else name
-    
-    headers = {
-        'User-Agent': 'BSLMap/1.0 (https://github.com/yourusername/bslmap; your.email@example.com)'
-    }
+    http = session or requests
     
     try:
-        response = requests.get(
-            base_url,
+        response = http.get(
+            NOMINATIM_URL,
             params={
                 'q': query,
                 'format': 'json',
                 'limit': 1,
                 'addressdetails': 1
             },
-            headers=headers
+            headers={'User-Agent': USER_AGENT},
+            timeout=30,
         )
         response.raise_for_status()
         
@@ -50,6 +95,39 @@ def geocode_institution(name: str, country: str = '') -> Optional[Tuple[float, f
         print(f"Error geocoding {name}: {str(e)}", file=sys.stderr)
         return None
 
+class CachedGeocoder:
+    """Geocoder backed by a persistent JSON cache and a shared HTTP session.
+    
+    Only cache misses hit Nominatim, and those are spaced to respect the
+    one-request-per-second policy.
+    """
+    
+    def __init__(self, cache_path: Path):
+        self.cache_path = cache_path
+        self.cache = load_geocode_cache(cache_path)
+        self.session = make_session()
+        self._last_request = 0.0
+    
+    def geocode(self, name: str, country: str = '') -> Optional[Tuple[float, float, str, str]]:
+        key = _cache_key(name, country)
+        if key in self.cache:
+            return tuple(self.cache[key])
+        
+        wait = MIN_REQUEST_INTERVAL - (time.monotonic() - self._last_request)
+        if wait > 0:
+            time.sleep(wait)
+        result = geocode_institution(name, country, session=self.session)
+        self._last_request = time.monotonic()
+        
+        # Only successes are cached so transient failures are retried next run
+        if result:
+            self.cache[key] = list(result)
+        return result
+    
+    def close(self) -> None:
+        save_geocode_cache(self.cache_path, self.cache)
+        self.session.close()
+
 def load_existing_labs(csv_path: Path) -> Dict[str, Dict]:
     """Load existing labs from CSV to avoid re-geocoding."""
     if not csv_path.exists():
@@ -62,10 +140,11 @@ def load_existing_labs(csv_path: Path) -> Dict[str, Dict]:
             labs[row['institution']] = row
     return labs
 
-def generate_labs_csv(institutions_path: Path, output_path: Path):
+def generate_labs_csv(institutions_path: Path, output_path: Path, cache_path: Optional[Path] = None):
     """Generate or update labs.csv from institutions.txt."""
     # Load existing labs to avoid re-geocoding
     existing_labs = load_existing_labs(output_path)
+    geocoder = CachedGeocoder(cache_path or output_path.parent / "cache" / "geocode.json")
     
     # Read institutions
     with open(institutions_path, 'r', encoding='utf-8') as f:
@@ -76,25 +155,28 @@ def generate_labs_csv(institutions_path: Path, output_path: Path):
     rows = []
     
     # Process each institution
-    for institution in tqdm(institutions, desc="Processing institutions"):
-        if institution in existing_labs:
-            rows.append(existing_labs[institution])
-            continue
-            
-        # Try to geocode with and without country
-        result = geocode_institution(institution)
-        if not result:
-            print(f"Warning: Could not geocode {institution}", file=sys.stderr)
-            continue
-            
-        lat, lon, city, country = result
-        rows.append({
-            'institution': institution,
-            'latitude': lat,
-            'longitude': lon,
-            'country': country,
-            'city': city
-        })
+    try:
+        for institution in tqdm(institutions, desc="Processing institutions"):
+            if institution in existing_labs:
+                rows.append(existing_labs[institution])
+                continue
+                
+            # Try to geocode with and without country
+            result = geocoder.geocode(institution)
+            if not result:
+                print(f"Warning: Could not geocode {institution}", file=sys.stderr)
+                continue
+                
+            lat, lon, city, country = result
+            rows.append({
+                'institution': institution,
+                'latitude': lat,
+                'longitude': lon,
+                'country': country,
+                'city': city
+            })
+    finally:
+        geocoder.close()
     
     # Write to CSV
     output_path.parent.mkdir(parents=True, exist_ok=True)
@@ -1,78 +1,110 @@
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import accumulate, islice
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Iterable, Iterator
 from tqdm import tqdm
 from bslmap.io_utils import read_jsonl, write_jsonl
-from bslmap.cfg import Settings
+from bslmap.cfg import Settings, get_settings
+
+# Records handed to the worker pool per round when corpus_workers > 1
+POOL_BLOCK_SIZE = 4096
 
 def _chunk(text: str, target: int, overlap: int) -> List[str]:
     if not text:
         return []
     words = text.split()
+    n = len(words)
     step = max(1, target - overlap)
-    chunks = []
-    for i in range(0, len(words), step):
-        chunk = " ".join(words[i:i+target])
-        if chunk:
-            chunks.append(chunk)
-    return chunks
+    # Join once with single spaces; each window is then a single slice of that
+    # string, with offs[i] the start of word i (offs[j] - 1 is the end of word j-1).
+    norm = " ".join(words)
+    offs = list(accumulate((len(w) + 1 for w in words), initial=0))
+    return [norm[offs[i]:offs[min(i + target, n)] - 1] for i in range(0, n, step)]
+
+def chunk_hash(text: str) -> str:
+    """Content hash identifying identical chunk texts across records."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
 
 def _links_index(eupmc_jsonl: Path) -> Dict[str, list]:
     idx: Dict[str, list] = {}
-    records = list(read_jsonl(eupmc_jsonl))
     
-    with tqdm(total=len(records), desc="Indexing EUPMC links", unit="record") as pbar:
-        for r in records:
+    with tqdm(desc="Indexing EUPMC links", unit="record", mininterval=1.0, miniters=1000) as pbar:
+        for r in read_jsonl(eupmc_jsonl):
             pmid = r.get("pmid")
-            if not pmid:
-                pbar.update(1)
-                continue
-            idx.setdefault(pmid, []).append(r)
+            if pmid:
+                idx.setdefault(pmid, []).append(r)
             pbar.update(1)
     
     return idx
 
-def build_corpus(pubmed_jsonl: Path, eupmc_jsonl: Path, out_jsonl: Path) -> None:
-    cfg = Settings()
-    print("Building corpus from PubMed and EUPMC data...")
+def _record_to_rows(rec: Dict, chunk_target: int, chunk_overlap: int) -> List[Dict]:
+    """Chunk one PubMed record into corpus rows (pure, so it can run in a worker)."""
+    pmid = rec.get("pmid")
+    title = rec.get("title","")
+    abstract = rec.get("abstract","")
+    fulltext = ""  # (keep abstract MVP; add fetchers if you want)
+    text = fulltext if fulltext else abstract
     
-    _links_index(eupmc_jsonl)  # Index available for future use
-    rows = []
-    
-    # Read all records first to get total count for progress bar
-    pubmed_records = list(read_jsonl(pubmed_jsonl))
-    print(f"Processing {len(pubmed_records)} PubMed records...")
+    if not text:
+        return []
+        
+    chunks = _chunk(text, chunk_target, chunk_overlap)
+    return [
+        {
+            "doc_id": f"pmid:{pmid}#chunk{i}",
+            "source": "pubmed",
+            "title": title,
+            "aff_hint": rec.get("institution_query",""),
+            "text": ch,
+            "chunk_hash": chunk_hash(ch),
+            "metadata": {
+                "pmid": pmid,
+                "journal": rec.get("fulljournalname",""),
+                "mesh_terms": rec.get("mesh_heading_list", []),
+            }
+        }
+        for i, ch in enumerate(chunks)
+    ]
+
+def _iter_record_rows(pubmed_records: Iterable[Dict], cfg: Settings) -> Iterator[List[Dict]]:
+    """Yield the rows of each record in input order, using a process pool if configured."""
+    to_rows = partial(
+        _record_to_rows,
+        chunk_target=cfg.chunk_target_tokens,
+        chunk_overlap=cfg.chunk_overlap_tokens,
+    )
+    if cfg.corpus_workers <= 1:
+        yield from map(to_rows, pubmed_records)
+        return
     
-    with tqdm(total=len(pubmed_records), desc="Building corpus", unit="record") as pbar:
-        for rec in pubmed_records:
-            pmid = rec.get("pmid")
-            title = rec.get("title","")
-            abstract = rec.get("abstract","")
-            fulltext = ""  # (keep abstract MVP; add fetchers if you want)
-            text = fulltext if fulltext else abstract
-            
-            if not text:
-                pbar.update(1)
-                continue
-                
-            chunks = _chunk(text, cfg.chunk_target_tokens, cfg.chunk_overlap_tokens)
-            for i, ch in enumerate(chunks):
-                rows.append({
-                    "doc_id": f"pmid:{pmid}#chunk{i}",
-                    "source": "pubmed",
-                    "title": title,
-                    "aff_hint": rec.get("institution_query",""),
-                    "text": ch,
-                    "metadata": {
-                        "pmid": pmid,
-                        "journal": rec.get("fulljournalname",""),
-                        "mesh_terms": rec.get("mesh_heading_list", []),
-                    }
-                })
-            
-            if len(chunks) > 1:
-                pbar.set_postfix_str(f"Generated {len(chunks)} chunks")
+    # Feed the pool bounded blocks so the input is still streamed, not materialized
+    records = iter(pubmed_records)
+    with ProcessPoolExecutor(max_workers=cfg.corpus_workers) as executor:
+        while True:
+            block = list(islice(records, POOL_BLOCK_SIZE))
+            if not block:
+                break
+            yield from executor.map(to_rows, block, chunksize=64)
+
+def _iter_corpus_rows(pubmed_records: Iterable[Dict], cfg: Settings) -> Iterator[Dict]:
+    """Yield corpus rows (one per chunk) for a stream of PubMed records."""
+    with tqdm(desc="Building corpus", unit="record", mininterval=1.0, miniters=1000) as pbar:
+        for rows in _iter_record_rows(pubmed_records, cfg):
+            yield from rows
+            if len(rows) > 1:
+                pbar.set_postfix_str(f"Generated {len(rows)} chunks")
             pbar.update(1)
+
+def build_corpus(pubmed_jsonl: Path, eupmc_jsonl: Path, out_jsonl: Path) -> None:
+    cfg = get_settings()
+    print("Building corpus from PubMed and EUPMC data...")
+    
+    # EUPMC links are not joined into the corpus yet; build _links_index(eupmc_jsonl)
+    # only once a consumer needs it rather than parsing the whole file for nothing.
     
-    print(f"\nWriting {len(rows)} corpus entries to {out_jsonl}...")
-    write_jsonl(out_jsonl, rows)
-    print(f"Corpus building completed. Total entries: {len(rows)}")
\ No newline at end of file
+    # Rows are generated lazily and written as they are produced
+    print(f"Writing corpus entries to {out_jsonl}...")
+    n_rows = write_jsonl(out_jsonl, _iter_corpus_rows(read_jsonl(pubmed_jsonl), cfg))
+    print(f"Corpus building completed. Total entries: {n_rows}")
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -5,6 +7,13 @@ class Settings(BaseSettings):
     max_per_institution: int = 1000
     email_for_ncbi: str = "your.email@example.org"
     europe_pmc_cc_by_only: bool = True
+    europe_pmc_requests_per_second: float = 2.0  # shared by all concurrent requests
     chunk_target_tokens: int = 1200
     chunk_overlap_tokens: int = 150
-    model_config = SettingsConfigDict(env_prefix="BSLMAP_", env_file="config/settings.toml")
\ No newline at end of file
+    corpus_workers: int = 1  # >1 chunks records in a process pool
+    model_config = SettingsConfigDict(env_prefix="BSLMAP_", env_file="config/settings.toml")
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Return the process-wide Settings, parsed from config/env only once."""
+    return Settings()
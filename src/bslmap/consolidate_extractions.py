@@ -1,10 +1,10 @@
 import re
 from pathlib import Path
-from collections import defaultdict
+import pandas as pd
 from tqdm import tqdm
-from bslmap.io_utils import read_jsonl
+from bslmap.io_utils import read_jsonl, WRITE_BUFFER_SIZE
 import csv
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Pattern, Tuple
 
 def load_labs_data(project_root: Path) -> Dict[str, Dict]:
     """Load institution data from labs.csv."""
@@ -13,19 +13,80 @@ def load_labs_data(project_root: Path) -> Dict[str, Dict]:
         print(f"Warning: {labs_path} not found. No institution data will be included.")
         return {}
     
-    labs = {}
-    with open(labs_path, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            # Use institution name as key for lookup
-            labs[row['institution'].lower()] = {
-                'institution': row['institution'],
-                'country': row.get('country', ''),
-                'city': row.get('city', ''),
-                'latitude': row.get('latitude', ''),
-                'longitude': row.get('longitude', '')
-            }
-    return labs
+    # Parse with pandas' C reader, keeping every value as the original string
+    df = pd.read_csv(labs_path, dtype=str, keep_default_na=False, encoding='utf-8')
+    df = df.reindex(columns=['institution', 'country', 'city', 'latitude', 'longitude'], fill_value='')
+    
+    # Use lowercased institution name as key for lookup
+    return {
+        name.lower(): {
+            'institution': name,
+            'country': country,
+            'city': city,
+            'latitude': latitude,
+            'longitude': longitude
+        }
+        for name, country, city, latitude, longitude in zip(
+            df['institution'], df['country'], df['city'], df['latitude'], df['longitude']
+        )
+    }
+
+def _pmid_of(doc_id: str) -> Optional[str]:
+    """Return the PMID of a ``pmid:<digits>[#chunkN]`` doc_id, or None."""
+    if not doc_id.startswith("pmid:"):
+        return None
+    end = doc_id.find("#", 5)
+    pmid = doc_id[5:end] if end >= 0 else doc_id[5:]
+    return pmid if pmid.isdigit() else None
+
+# Abbreviations/partial names that also identify an institution in evidence text
+INSTITUTION_ALIASES: Dict[str, List[str]] = {
+    "national institute of allergy and infectious diseases": [
+        "niaid", "national institute of allergy", "nih",
+    ],
+}
+
+# Compiled lab-name pattern, alias pattern and term -> lab entry map
+InstitutionMatcher = Tuple[Optional[Pattern[str]], Optional[Pattern[str]], Dict[str, Dict]]
+
+def _build_institution_matcher(labs_data: Dict[str, Dict]) -> InstitutionMatcher:
+    """Compile lab names and their aliases into patterns, built once per run.
+    
+    Returns a pattern over the full lab names, a pattern over the aliases
+    (each is None when there is nothing to match) and a map from each
+    lowercased term to its lab entry. Aliases are matched as whole words.
+    """
+    terms: Dict[str, Dict] = dict(labs_data)
+    aliases: List[str] = []
+    for inst_name, inst_data in labs_data.items():
+        for full_name, inst_aliases in INSTITUTION_ALIASES.items():
+            if full_name in inst_name:
+                for alias in inst_aliases:
+                    if alias not in terms:
+                        terms[alias] = inst_data
+                        aliases.append(alias)
+    
+    def _alternation(words: List[str]) -> str:
+        # Longer terms first, so a name wins over any prefix of it
+        return "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+    
+    name_pattern = re.compile(_alternation(list(labs_data))) if labs_data else None
+    alias_pattern = re.compile(rf"\b(?:{_alternation(aliases)})\b") if aliases else None
+    return name_pattern, alias_pattern, terms
+
+def _match_institution(evidence: str, matcher: InstitutionMatcher) -> Optional[Dict]:
+    """Lab entry named in lowercased evidence text, or None.
+    
+    Full lab names take precedence over aliases: the alias pattern is only
+    consulted when no full name occurs anywhere in the evidence.
+    """
+    name_pattern, alias_pattern, terms = matcher
+    for pattern in (name_pattern, alias_pattern):
+        if pattern is not None:
+            m = pattern.search(evidence)
+            if m:
+                return terms[m.group(0)]
+    return None
 
 def merge_extractions(in_jsonl: Path, out_csv: Path, corpus_jsonl: Optional[Path] = None) -> None:
     print("Consolidating extractions...")
@@ -33,35 +94,37 @@ def merge_extractions(in_jsonl: Path, out_csv: Path, corpus_jsonl: Optional[Path
     # Load institution data
     project_root = Path(__file__).parent.parent.parent
     labs_data = load_labs_data(project_root)
+    inst_matcher = _build_institution_matcher(labs_data)
     
-    # Load corpus data if provided
-    corpus = []
+    # Index corpus data by PMID if provided (first chunk per PMID wins)
+    corpus_by_pmid: Dict[str, Dict] = {}
     if corpus_jsonl and corpus_jsonl.exists():
-        corpus = list(read_jsonl(corpus_jsonl))
+        for r in read_jsonl(corpus_jsonl):
+            pmid = _pmid_of(r.get("doc_id", ""))
+            if pmid and pmid not in corpus_by_pmid:
+                corpus_by_pmid[pmid] = r
     
-    by_pmid = defaultdict(list)
-    records = list(read_jsonl(in_jsonl))
+    # Keep only the highest-confidence record per PMID (first one wins ties)
+    best_by_pmid: Dict[str, Dict] = {}
     
-    print(f"Processing {len(records)} extraction records...")
-    with tqdm(total=len(records), desc="Grouping by PMID", unit="record") as pbar:
-        for r in records:
-            m = re.match(r"pmid:(\d+)", r.get("doc_id",""))
-            if not m:
-                pbar.update(1)
-                continue
-            by_pmid[m.group(1)].append(r)
+    print(f"Processing extraction records from {in_jsonl}...")
+    with tqdm(desc="Selecting best extractions", unit="record", mininterval=1.0, miniters=1000) as pbar:
+        for r in read_jsonl(in_jsonl):
+            pmid = _pmid_of(r.get("doc_id",""))
+            # Chunks skipped by the extraction prefilter carry no fields
+            if pmid and not r.get("skipped"):
+                cur = best_by_pmid.get(pmid)
+                if cur is None or r.get("confidence", 0) > cur.get("confidence", 0):
+                    best_by_pmid[pmid] = r
             pbar.update(1)
 
-    print(f"\nMerging {len(by_pmid)} unique PMIDs...")
+    print(f"\nMerging {len(best_by_pmid)} unique PMIDs...")
     rows = []
-    with tqdm(total=len(by_pmid), desc="Selecting best extractions", unit="pmid") as pbar:
-        for pmid, recs in by_pmid.items():
-            best = sorted(recs, key=lambda x: x.get("confidence", 0), reverse=True)[0]
-            
+    with tqdm(total=len(best_by_pmid), desc="Merging extractions", unit="pmid",
+              mininterval=1.0, miniters=max(1, len(best_by_pmid) // 1000)) as pbar:
+        for pmid, best in best_by_pmid.items():
             # Get the original corpus record to extract institution information
-            corpus_rec = {}
-            if corpus:
-                corpus_rec = next((r for r in corpus if r.get("doc_id", "").startswith(f"pmid:{pmid}")), {})
+            corpus_rec = corpus_by_pmid.get(pmid, {})
             
             # Try to find matching institution data
             institution_match = None
@@ -72,32 +135,21 @@ def merge_extractions(in_jsonl: Path, out_csv: Path, corpus_jsonl: Optional[Path
                 if inst_name in labs_data:
                     institution_match = labs_data[inst_name]
             
-            # If no direct match, try to find in evidence spans
-            if not institution_match:
-                evidence = ". ".join(best.get("evidence_spans", [""])).lower()
-                if evidence and labs_data:
+            # If no direct match, try to find in evidence spans; the evidence is
+            # joined and lowercased once per PMID, and only when there is
+            # something to match it against
+            if not institution_match and labs_data:
+                spans = best.get("evidence_spans")
+                evidence = ". ".join(spans).lower() if spans else ""
+                if evidence:
                     if DEBUG := False:  # Set to True for debugging
                         print(f"\nProcessing PMID: {pmid}")
                         print(f"Evidence: {evidence[:200]}...")
                     
-                    # Try different matching strategies
-                    for inst_name, inst_data in labs_data.items():
-                        # 1. Check for exact match
-                        if inst_name.lower() in evidence:
-                            if DEBUG:
-                                print(f"Found exact match for: {inst_name}")
-                            institution_match = inst_data
-                            break
-                            
-                        # 2. Check for partial match using common abbreviations
-                        inst_lower = inst_name.lower()
-                        if "national institute of allergy and infectious diseases" in inst_lower:
-                            # Check for common abbreviations and partial matches
-                            if any(term in evidence for term in ["niaid", "national institute of allergy", "nih"]):
-                                if DEBUG:
-                                    print(f"Found partial/abbreviation match for: {inst_name}")
-                                institution_match = inst_data
-                                break
+                    # One pass for all full names, then (only if none matched) one for all aliases
+                    institution_match = _match_institution(evidence, inst_matcher)
+                    if DEBUG and institution_match:
+                        print(f"Found match for: {institution_match['institution']}")
             
             # Get institution from corpus record if available, otherwise from extraction or labs_data
             institution = (
@@ -127,7 +179,7 @@ def merge_extractions(in_jsonl: Path, out_csv: Path, corpus_jsonl: Optional[Path
 
     print(f"\nWriting {len(rows)} consolidated records to CSV...")
     out_csv.parent.mkdir(parents=True, exist_ok=True)
-    with out_csv.open("w", newline="", encoding="utf-8") as f:
+    with out_csv.open("w", newline="", encoding="utf-8", buffering=WRITE_BUFFER_SIZE) as f:
         fieldnames = [
             "pmid", "lab_name", "institution", "country", "city", 
             "latitude", "longitude", "bsl_level_inferred",
@@ -135,9 +187,6 @@ def merge_extractions(in_jsonl: Path, out_csv: Path, corpus_jsonl: Optional[Path
         ]
         w = csv.DictWriter(f, fieldnames=fieldnames)
         w.writeheader()
-        with tqdm(total=len(rows), desc="Writing CSV rows", unit="row") as pbar:
-            for r in rows:
-                w.writerow(r)
-                pbar.update(1)
+        w.writerows(rows)
     
     print(f"Consolidation completed. Output: {out_csv}")
\ No newline at end of file
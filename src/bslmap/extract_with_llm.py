@@ -1,19 +1,48 @@
 """Module for extracting BSL lab information using a local LLM."""
 
+import copy
 import json
+import re
 import time
 import logging
 import traceback
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
-from typing import Dict, Any, Optional, List, Tuple
+from typing import Dict, Any, Optional, List, Pattern, Tuple
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import AutoModelForCausalLM, AutoTokenizer, StoppingCriteria, StoppingCriteriaList
 from tqdm import tqdm
-from bslmap.io_utils import read_jsonl
+from pydantic import BaseModel
+from bslmap.io_utils import WRITE_BUFFER_SIZE, dumps_line, read_jsonl
+from bslmap.build_corpus import chunk_hash
+from bslmap.extraction_cache import DEFAULT_CACHE_PATH, ExtractionCache, cache_key
+
+try:
+    import outlines
+except ImportError:  # schema-constrained decoding is optional
+    outlines = None
+
+try:
+    import vllm
+except ImportError:  # the vLLM backend is optional
+    vllm = None
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Small instruction-tuned causal LM; follows the JSON format far more reliably
+# than base GPT-2 at a size that still fits comfortably on a single GPU
+MODEL_NAME = "Qwen/Qwen2.5-1.5B-Instruct"
+
+# Generation limits, also used to size token-budgeted batches
+MAX_PROMPT_TOKENS = 1024
+MAX_NEW_TOKENS = 200
+
+# process_corpus reads batch_size * WINDOW_BATCHES chunks at a time; large
+# enough for dedup and length bucketing to pay off, small enough to stream
+WINDOW_BATCHES = 64
+
 def log_memory_usage() -> None:
     """Log current memory usage."""
     try:
@@ -25,6 +54,67 @@ def log_memory_usage() -> None:
     except Exception as e:
         logger.warning(f"Could not log memory usage: {str(e)}")
 
+def _int4_quantization_config():
+    """
+    Int4 weight config: torchao int4 weight-only, else bitsandbytes NF4 with
+    bf16 compute, else None (unquantized) when neither is installed.
+    """
+    try:
+        import torchao  # noqa: F401
+        from transformers import TorchAoConfig
+        return TorchAoConfig("int4_weight_only", group_size=128)
+    except ImportError:
+        pass
+    try:
+        import bitsandbytes  # noqa: F401
+        from transformers import BitsAndBytesConfig
+        return BitsAndBytesConfig(
+            load_in_4bit=True,
+            bnb_4bit_quant_type="nf4",
+            bnb_4bit_compute_dtype=torch.bfloat16,
+        )
+    except ImportError:
+        logger.info("Neither torchao nor bitsandbytes installed; loading unquantized weights")
+        return None
+
+def _compile_for_decode(model) -> None:
+    """
+    Use a preallocated KV cache and a compiled forward so each decode step
+    replays one captured CUDA graph instead of launching many small kernels.
+    """
+    model.generation_config.cache_implementation = "static"
+    model.generation_config.max_length = MAX_PROMPT_TOKENS + MAX_NEW_TOKENS
+    model.forward = torch.compile(model.forward, mode="reduce-overhead", fullgraph=True)
+
+def warmup_model(model, tokenizer, base_prompt: str, batch_size: int) -> None:
+    """Run throwaway generations so compilation happens before the timed loop.
+    
+    No-op unless the model was compiled by load_model_and_tokenizer. Each
+    warmup decodes the full MAX_NEW_TOKENS, at the longest prompt width and
+    then at a short one, so the decode graphs and prefill over varying padded
+    widths are compiled here. Only batch_size rows are warmed: a batch of
+    another size (the last one, or any under max_batch_tokens) can still
+    trigger one more compile.
+    """
+    if getattr(getattr(model, "generation_config", None), "cache_implementation", None) != "static":
+        return
+    for filler in ("warmup " * 800, "warmup"):
+        prompt = format_prompt({"text": filler}, base_prompt)
+        inputs = tokenizer(
+            [prompt] * batch_size,
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+            max_length=MAX_PROMPT_TOKENS,
+            return_token_type_ids=False
+        ).to(model.device)
+        # The first call compiles and the second records the CUDA graphs
+        with torch.no_grad():
+            for _ in range(2):
+                model.generate(**inputs, max_new_tokens=MAX_NEW_TOKENS,
+                               min_new_tokens=MAX_NEW_TOKENS, do_sample=False,
+                               pad_token_id=tokenizer.pad_token_id)
+
 def load_model_and_tokenizer(debug: bool = False):
     """
     Load an efficient LLM and tokenizer optimized for extraction tasks.
@@ -35,9 +125,7 @@ def load_model_and_tokenizer(debug: bool = False):
     Returns:
         Tuple containing (model, tokenizer)
     """
-    # Use a smaller causal LM that's better for structured output
-    # GPT-2 medium is good for instruction following and JSON generation
-    model_name = "gpt2-medium"  # Smaller, faster model for structured output
+    model_name = MODEL_NAME
     
     if debug:
         logger.info(f"Loading model: {model_name}")
@@ -56,6 +144,8 @@ def load_model_and_tokenizer(debug: bool = False):
         # Fix padding token issue
         if tokenizer.pad_token is None:
             tokenizer.pad_token = tokenizer.eos_token
+        # Causal LMs continue from the last position, so batches pad on the left
+        tokenizer.padding_side = "left"
         
         if debug:
             logger.info(f"Tokenizer loaded in {time.time() - start_time:.2f}s")
@@ -68,7 +158,7 @@ def load_model_and_tokenizer(debug: bool = False):
             torch_dtype = torch.float16  # Use half precision for speed
         elif torch.cuda.is_available():
             device = "cuda"
-            torch_dtype = torch.float16
+            torch_dtype = torch.bfloat16
         else:
             device = "cpu"
             torch_dtype = torch.float32
@@ -76,14 +166,33 @@ def load_model_and_tokenizer(debug: bool = False):
         if debug:
             logger.info(f"Using device: {device} with dtype: {torch_dtype}")
         
-        model = AutoModelForCausalLM.from_pretrained(
-            model_name,
-            torch_dtype=torch_dtype,
-            low_cpu_mem_usage=True,
-        )
+        # Decoding is bound by weight bandwidth, so on CUDA load int4 weights
+        # when torchao or bitsandbytes is available
+        quantization_config = _int4_quantization_config() if device == "cuda" else None
+        if quantization_config is not None:
+            if debug:
+                logger.info(f"Quantizing weights to int4 ({type(quantization_config).__name__})")
+            model = AutoModelForCausalLM.from_pretrained(
+                model_name,
+                torch_dtype=torch_dtype,
+                quantization_config=quantization_config,
+                device_map=device,
+            )
+        else:
+            model = AutoModelForCausalLM.from_pretrained(
+                model_name,
+                torch_dtype=torch_dtype,
+                low_cpu_mem_usage=True,
+            )
+            
+            # Move to optimal device
+            model = model.to(device)
         
-        # Move to optimal device
-        model = model.to(device)
+        # bitsandbytes kernels don't trace under fullgraph torch.compile
+        if device == "cuda" and getattr(quantization_config, "quant_method", None) != "bitsandbytes":
+            _compile_for_decode(model)
+            if debug:
+                logger.info("Compiled model forward with a static KV cache")
         
         if debug:
             logger.info(f"Model loaded in {time.time() - start_time:.2f}s")
@@ -100,6 +209,61 @@ def load_model_and_tokenizer(debug: bool = False):
             logger.error(f"Traceback: {traceback.format_exc()}")
         raise
 
+def load_vllm(model_name: str = MODEL_NAME, quantization: Optional[str] = None, debug: bool = False):
+    """
+    Load MODEL_NAME into a vLLM engine (PagedAttention, continuous batching).
+    
+    Args:
+        model_name: HF model id or local path, e.g. an AWQ-quantized checkpoint
+        quantization: vLLM quantization method matching the checkpoint
+            (e.g. "awq"); None loads the weights as stored
+        debug: If True, log load time
+    
+    Returns:
+        Tuple containing (llm, tokenizer); the tokenizer is the engine's own
+        HF tokenizer, used for length bucketing
+    """
+    if vllm is None:
+        raise ImportError("vllm is not installed; use the transformers backend")
+    start_time = time.time()
+    llm = vllm.LLM(
+        model=model_name,
+        dtype="auto",
+        quantization=quantization,
+        # Every prompt starts with the byte-identical STATIC_PREFIX, so its KV
+        # blocks are computed once and shared across requests
+        enable_prefix_caching=True,
+        max_model_len=MAX_PROMPT_TOKENS + MAX_NEW_TOKENS,
+    )
+    # Extraction cache keys come from name_or_path, as on HF models; a
+    # quantized engine's outputs are kept apart from full-precision ones
+    llm.name_or_path = f"{model_name}+{quantization}" if quantization else model_name
+    if debug:
+        logger.info(f"vLLM engine for {model_name} loaded in {time.time() - start_time:.2f}s")
+    return llm, llm.get_tokenizer()
+
+def _is_vllm(model) -> bool:
+    return vllm is not None and isinstance(model, vllm.LLM)
+
+# Keyword list also used for the PubMed queries
+DEFAULT_KEYWORDS_PATH = Path(__file__).parent.parent.parent / "config" / "pathogen_keywords.txt"
+
+def build_prefilter(keywords_path: Path = DEFAULT_KEYWORDS_PATH) -> Optional[Pattern[str]]:
+    """
+    Compile one case-insensitive pattern that any chunk worth sending to the
+    LLM must match: the pathogen/biosafety keywords plus BSL-3/4 spellings.
+    
+    Returns None (no filtering) if the keyword file cannot be read.
+    """
+    try:
+        keywords = [k.strip() for k in keywords_path.read_text(encoding="utf-8").splitlines()]
+    except OSError as e:
+        logger.warning(f"Could not load keywords from {keywords_path}: {e}; prefilter disabled")
+        return None
+    terms = [rf"\b{re.escape(k)}\b" for k in keywords if k and not k.startswith("#")]
+    terms += [r"A?BSL-?[34]\b", r"\bbiosafety level[- ]?(?:3|4|three|four)\b"]
+    return re.compile("|".join(terms), re.IGNORECASE)
+
 def load_prompt_from_config() -> str:
     """Load the extraction prompt from config/prompt.md."""
     try:
@@ -133,6 +297,16 @@ Rules:
 - Do not include operational details (floorplans, shift times, staff rosters).
 - If the chunk is too vague, return only {"doc_id": "..."}."""
 
+# Instruction + few-shot example shared by every prompt. It ends on a blank
+# line so the split from the per-chunk part falls on a token boundary.
+STATIC_PREFIX = """Extract BSL lab information from biomedical text and return valid JSON.
+
+Example:
+Text: "We conducted experiments with SARS-CoV-2 in our BSL-3 facility at Johns Hopkins."
+JSON: {"pathogens": ["SARS-CoV-2"], "research_types": ["experimental"], "evidence_spans": ["experiments with SARS-CoV-2 in our BSL-3 facility"], "confidence": 0.9, "ppp_or_gof": false}
+
+"""
+
 def format_prompt(chunk: Dict[str, Any], base_prompt: str) -> str:
     """
     Format the extraction prompt with document information for causal LMs.
@@ -147,132 +321,422 @@ def format_prompt(chunk: Dict[str, Any], base_prompt: str) -> str:
     # Extract metadata
     text = chunk.get("text", "")[:800]  # Limit text length
     
-    # Create a GPT-optimized prompt with examples
-    formatted_prompt = f"""Extract BSL lab information from biomedical text and return valid JSON.
+    # Shared instruction/example prefix, then the chunk itself
+    return f"{STATIC_PREFIX}Text: {text}\nJSON:"
 
-Example:
-Text: "We conducted experiments with SARS-CoV-2 in our BSL-3 facility at Johns Hopkins."
-JSON: {{"pathogens": ["SARS-CoV-2"], "research_types": ["experimental"], "evidence_spans": ["experiments with SARS-CoV-2 in our BSL-3 facility"], "confidence": 0.9, "ppp_or_gof": false}}
+# Token ids of STATIC_PREFIX and its precomputed KV cache
+PrefixCache = Tuple[Any, Any]
 
-Text: {text}
-JSON:"""
+def build_prefix_cache(model, tokenizer) -> Optional[PrefixCache]:
+    """
+    Run prefill over STATIC_PREFIX once so batches only prefill their own text.
     
-    return formatted_prompt
+    Returns None when the model uses a static (compiled) KV cache, which
+    cannot be seeded with a dynamic prefix cache.
+    """
+    if getattr(getattr(model, "generation_config", None), "cache_implementation", None) == "static":
+        return None
+    prefix = tokenizer(STATIC_PREFIX, return_tensors="pt", return_token_type_ids=False).to(model.device)
+    with torch.no_grad():
+        out = model(**prefix, use_cache=True)
+    return prefix["input_ids"], out.past_key_values
 
-def extract_from_chunk(
-    chunk: Dict[str, Any], 
-    model, 
-    tokenizer, 
-    base_prompt: str,
-    max_new_tokens: int = 512
-) -> Dict[str, Any]:
-    """Extract information from a single chunk of text using LLM."""
-    try:
-        # Format the prompt
-        prompt = format_prompt(chunk, base_prompt)
-        
-        # Tokenize input with reduced max length for speed
+@lru_cache(maxsize=4)
+def _brace_tables(tokenizer, vocab_size: int) -> Tuple[Any, Any]:
+    """
+    Per-token-id net brace count and whether the token contains "{".
+    
+    The model's embedding matrix is often padded past the tokenizer's
+    vocabulary (151936 vs 151665 ids for Qwen2.5), so the tables cover
+    max(len(tokenizer), vocab_size) ids; the padding ids carry no braces.
+    """
+    n_ids = max(len(tokenizer), vocab_size)
+    tokens = tokenizer.convert_ids_to_tokens(list(range(len(tokenizer))))
+    tokens += [None] * (n_ids - len(tokens))
+    deltas = torch.tensor([t.count("{") - t.count("}") if t else 0 for t in tokens], dtype=torch.int32)
+    opens = torch.tensor([bool(t) and "{" in t for t in tokens], dtype=torch.bool)
+    return deltas, opens
+
+class BraceBalanceStopping(StoppingCriteria):
+    """
+    Stop each row once its first JSON object has closed.
+    
+    Brace balance is tracked per row from precomputed per-token counts, so no
+    decoding happens inside the generation loop. Braces seen before the first
+    "{" are ignored; finished rows stay finished while others keep going.
+    """
+    
+    def __init__(self, tokenizer, batch_size: int, device, vocab_size: int = 0):
+        deltas, opens = _brace_tables(tokenizer, vocab_size)
+        self.deltas = deltas.to(device)
+        self.opens = opens.to(device)
+        self.balance = torch.zeros(batch_size, dtype=torch.int32, device=device)
+        self.opened = torch.zeros(batch_size, dtype=torch.bool, device=device)
+        self.done = torch.zeros(batch_size, dtype=torch.bool, device=device)
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        last = input_ids[:, -1]
+        self.opened |= self.opens[last]
+        self.balance = torch.where(self.opened, self.balance + self.deltas[last], self.balance)
+        self.done |= self.opened & (self.balance <= 0)
+        return self.done.clone()
+
+def _generate_responses(
+    prompts: List[str],
+    model,
+    tokenizer,
+    prefix_cache: Optional[PrefixCache] = None
+) -> List[str]:
+    """Run one batched generation and return only the newly generated text per prompt."""
+    if prefix_cache is not None and all(p.startswith(STATIC_PREFIX) for p in prompts):
+        # Only the per-chunk suffixes are tokenized (left padded); the shared
+        # prefix comes from the cache. Padding then sits between prefix and
+        # suffix, which the attention mask and derived positions skip over.
+        prefix_ids, prefix_kv = prefix_cache
+        n, prefix_len = len(prompts), prefix_ids.shape[1]
+        suffix = tokenizer(
+            [p[len(STATIC_PREFIX):] for p in prompts],
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+            max_length=MAX_PROMPT_TOKENS - prefix_len,
+            return_token_type_ids=False
+        ).to(model.device)
+        inputs = {
+            "input_ids": torch.cat([prefix_ids.expand(n, -1), suffix["input_ids"]], dim=1),
+            "attention_mask": torch.cat([
+                torch.ones((n, prefix_len), dtype=suffix["attention_mask"].dtype, device=model.device),
+                suffix["attention_mask"],
+            ], dim=1),
+        }
+        # generate() extends the cache in place, so every batch gets its own copy
+        past_key_values = copy.deepcopy(prefix_kv)
+        past_key_values.batch_repeat_interleave(n)
+        inputs["past_key_values"] = past_key_values
+    else:
+        # Tokenize the whole batch at once; the tokenizer pads on the left so
+        # every row's prompt ends where generation starts
         inputs = tokenizer(
-            prompt,
+            prompts,
             return_tensors="pt",
             padding=True,
             truncation=True,
-            max_length=1024,  # Reduced from 2048 for faster processing
+            max_length=MAX_PROMPT_TOKENS,  # Reduced from 2048 for faster processing
             return_token_type_ids=False
         ).to(model.device)
+    
+    # The JSON object usually closes well before MAX_NEW_TOKENS; stop there
+    stopping = StoppingCriteriaList([
+        BraceBalanceStopping(
+            tokenizer, inputs["input_ids"].shape[0], model.device, model.config.vocab_size
+        )
+    ])
+    
+    # Generate response with GPT-specific parameters for structured output
+    with torch.no_grad():
+        outputs = model.generate(
+            **inputs,
+            stopping_criteria=stopping,
+            max_new_tokens=MAX_NEW_TOKENS,  # Enough for JSON output
+            do_sample=True,      # Use sampling for creativity
+            temperature=0.3,     # Low temperature for consistency
+            top_p=0.9,          # Nucleus sampling
+            pad_token_id=tokenizer.pad_token_id,
+            eos_token_id=tokenizer.eos_token_id
+        )
+    
+    # Decode only the generated part of each row (drop the padded prompt)
+    generated = outputs[:, inputs["input_ids"].shape[1]:]
+    return [response.strip() for response in tokenizer.batch_decode(generated, skip_special_tokens=True)]
+
+def _generate_vllm(prompts: List[str], llm) -> List[str]:
+    """Generate for all prompts in one vLLM call; the engine schedules the batching."""
+    params = vllm.SamplingParams(temperature=0.0, max_tokens=MAX_NEW_TOKENS)
+    outputs = llm.generate(prompts, params, use_tqdm=False)
+    return [out.outputs[0].text.strip() for out in outputs]
+
+def _generate_response(prompt: str, model, tokenizer) -> str:
+    """Run generation for one prompt and return only the newly generated text."""
+    return _generate_responses([prompt], model, tokenizer)[0]
+
+class BSLExtraction(BaseModel):
+    """Fields the model emits per chunk under constrained decoding.
+    
+    doc_id and a missing source_pmid are filled in by finalize_extraction.
+    """
+    lab_name: Optional[str] = None
+    institution: Optional[str] = None
+    country: Optional[str] = None
+    city: Optional[str] = None
+    bsl_level_inferred: Optional[str] = None
+    pathogens: List[str]
+    research_types: List[str]
+    evidence_spans: List[str]
+    confidence: float
+    ppp_or_gof: bool
+    source_pmid: Optional[str] = None
+
+def build_json_generator(model, tokenizer):
+    """
+    Build an outlines generator whose output always validates as BSLExtraction.
+    
+    Returns None (free-form generation + parse_extraction) when outlines is
+    not installed.
+    """
+    if outlines is None:
+        logger.warning("outlines not installed; falling back to free-form JSON generation")
+        return None
+    sampler = outlines.samplers.multinomial(temperature=0.3, top_p=0.9)
+    return outlines.generate.json(outlines.models.Transformers(model, tokenizer), BSLExtraction, sampler=sampler)
+
+def _generate_constrained(prompts: List[str], json_generator) -> List[Dict[str, Any]]:
+    """Run the schema-constrained generator over a batch; output is already parsed."""
+    outputs = json_generator(prompts, max_tokens=MAX_NEW_TOKENS)
+    if isinstance(outputs, BSLExtraction):  # single prompt
+        outputs = [outputs]
+    return [out.model_dump(exclude_none=True) for out in outputs]
+
+def parse_extraction(response: str, doc_id: str = "") -> Optional[Dict[str, Any]]:
+    """Pull the first balanced JSON object out of a model response, or None."""
+    # Extract JSON part from the response more robustly
+    json_start = response.find('{')
+    if json_start == -1:
+        # Try to find JSON after "JSON:" marker
+        json_marker = response.find('JSON:')
+        if json_marker != -1:
+            json_start = response.find('{', json_marker)
+    
+    if json_start == -1:
+        return None
+    
+    # Find the matching closing brace
+    brace_count = 0
+    json_end = json_start
+    for i, char in enumerate(response[json_start:], json_start):
+        if char == '{':
+            brace_count += 1
+        elif char == '}':
+            brace_count -= 1
+            if brace_count == 0:
+                json_end = i + 1
+                break
+    
+    if json_end == json_start:
+        return None
         
-        # Generate response with GPT-specific parameters for structured output
-        with torch.no_grad():
-            outputs = model.generate(
-                **inputs,
-                max_new_tokens=200,  # Enough for JSON output
-                do_sample=True,      # Use sampling for creativity
-                temperature=0.3,     # Low temperature for consistency
-                top_p=0.9,          # Nucleus sampling
-                pad_token_id=tokenizer.pad_token_id,
-                eos_token_id=tokenizer.eos_token_id
-            )
-        
-        # Decode and parse response
-        response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-        
-        # Extract only the generated part (remove the input prompt)
-        prompt_length = len(tokenizer.decode(inputs['input_ids'][0], skip_special_tokens=True))
-        if len(response) > prompt_length:
-            response = response[prompt_length:].strip()
-        
-        # Extract JSON part from the response more robustly
-        json_start = response.find('{')
-        if json_start == -1:
-            # Try to find JSON after "JSON:" marker
-            json_marker = response.find('JSON:')
-            if json_marker != -1:
-                json_start = response.find('{', json_marker)
-        
-        if json_start == -1:
-            return {"doc_id": chunk.get("doc_id", "")}
-        
-        # Find the matching closing brace
-        brace_count = 0
-        json_end = json_start
-        for i, char in enumerate(response[json_start:], json_start):
-            if char == '{':
-                brace_count += 1
-            elif char == '}':
-                brace_count -= 1
-                if brace_count == 0:
-                    json_end = i + 1
-                    break
-        
-        if json_end == json_start:
-            return {"doc_id": chunk.get("doc_id", "")}
-            
-        json_str = response[json_start:json_end]
+    json_str = response[json_start:json_end]
+    
+    try:
+        result = json.loads(json_str)
+    except json.JSONDecodeError as e:
+        print(f"JSON decode error for {doc_id or 'unknown'}: {e}")
+        print(f"Attempted to parse: {json_str[:200]}...")
+        print(f"Full response: {response[:500]}...")
+        return None
+    return result if isinstance(result, dict) else None
+
+def finalize_extraction(raw: Dict[str, Any], chunk: Dict[str, Any]) -> Dict[str, Any]:
+    """Attach chunk-specific fields and defaults to a raw model extraction.
+    
+    ``raw`` is not modified, so one raw result (e.g. from the cache) can be
+    finalized for several chunks.
+    """
+    result = dict(raw)
+    
+    # Ensure doc_id is preserved
+    result["doc_id"] = chunk.get("doc_id", "")
+    
+    # Extract PMID from doc_id if source_pmid is missing
+    if "source_pmid" not in result or not result["source_pmid"]:
+        doc_id = chunk.get("doc_id", "")
+        if "pmid:" in doc_id:
+            pmid = doc_id.split("pmid:")[1].split("#")[0]
+            result["source_pmid"] = pmid
+    
+    # Include institution information from the input chunk if available
+    if "aff_hint" in chunk and chunk["aff_hint"]:
+        result["institution"] = chunk["aff_hint"]
+    
+    # Ensure required fields exist with proper defaults
+    if "pathogens" not in result:
+        result["pathogens"] = []
+    if "research_types" not in result:
+        result["research_types"] = []
+    if "evidence_spans" not in result:
+        result["evidence_spans"] = []
+    if "confidence" not in result:
+        result["confidence"] = 0.5
+    if "ppp_or_gof" not in result:
+        result["ppp_or_gof"] = False
         
-        try:
-            result = json.loads(json_str)
-            
-            # Ensure doc_id is preserved
-            result["doc_id"] = chunk.get("doc_id", "")
-            
-            # Extract PMID from doc_id if source_pmid is missing
-            if "source_pmid" not in result or not result["source_pmid"]:
-                doc_id = chunk.get("doc_id", "")
-                if "pmid:" in doc_id:
-                    pmid = doc_id.split("pmid:")[1].split("#")[0]
-                    result["source_pmid"] = pmid
-            
-            # Include institution information from the input chunk if available
-            if "aff_hint" in chunk and chunk["aff_hint"]:
-                result["institution"] = chunk["aff_hint"]
-            
-            # Ensure required fields exist with proper defaults
-            if "pathogens" not in result:
-                result["pathogens"] = []
-            if "research_types" not in result:
-                result["research_types"] = []
-            if "evidence_spans" not in result:
-                result["evidence_spans"] = []
-            if "confidence" not in result:
-                result["confidence"] = 0.5
-            if "ppp_or_gof" not in result:
-                result["ppp_or_gof"] = False
-                
-            return result
-            
-        except json.JSONDecodeError as e:
-            print(f"JSON decode error for {chunk.get('doc_id', 'unknown')}: {e}")
-            print(f"Attempted to parse: {json_str[:200]}...")
-            print(f"Full response: {response[:500]}...")
-            return {"doc_id": chunk.get("doc_id", "")}
-            
+    return result
+
+def _extract_raw(prompt: str, chunk: Dict[str, Any], model, tokenizer) -> Optional[Dict[str, Any]]:
+    """Generate and parse one extraction; None if the model gave no usable JSON."""
+    try:
+        response = _generate_response(prompt, model, tokenizer)
+        return parse_extraction(response, chunk.get("doc_id", ""))
     except Exception as e:
         print(f"LLM extraction error for {chunk.get('doc_id', 'unknown')}: {str(e)}")
-        import traceback
         print(f"Traceback: {traceback.format_exc()}")
+        return None
+
+def extract_from_chunk(
+    chunk: Dict[str, Any], 
+    model, 
+    tokenizer, 
+    base_prompt: Optional[str] = None,
+    max_new_tokens: int = 512
+) -> Dict[str, Any]:
+    """Extract information from a single chunk of text using LLM."""
+    if base_prompt is None:
+        base_prompt = load_prompt_from_config()
+    raw = _extract_raw(format_prompt(chunk, base_prompt), chunk, model, tokenizer)
+    if raw is None:
         return {"doc_id": chunk.get("doc_id", "")}
+    return finalize_extraction(raw, chunk)
+
+def _prompt_lengths(prompts: List[str], tokenizer) -> List[int]:
+    """Token length of each prompt, truncated the same way as for generation."""
+    encoded = tokenizer(prompts, truncation=True, max_length=MAX_PROMPT_TOKENS)
+    return [len(ids) for ids in encoded["input_ids"]]
+
+def plan_batches(
+    lengths: List[int],
+    batch_size: int,
+    max_batch_tokens: Optional[int] = None
+) -> List[List[int]]:
+    """
+    Group item indices into batches of similar prompt length.
+    
+    Items are ordered by token length so every batch pads to a near-uniform
+    width. With ``max_batch_tokens`` a batch grows while
+    ``rows * (longest prompt + MAX_NEW_TOKENS)`` stays within the budget, so
+    short prompts share larger batches; otherwise each batch holds
+    ``batch_size`` items.
+    """
+    order = sorted(range(len(lengths)), key=lengths.__getitem__)
+    batches: List[List[int]] = []
+    current: List[int] = []
+    for idx in order:
+        # Ascending order: the newest item is always the widest in the batch
+        width = lengths[idx] + MAX_NEW_TOKENS
+        if current and (
+            (len(current) + 1) * width > max_batch_tokens if max_batch_tokens
+            else len(current) >= batch_size
+        ):
+            batches.append(current)
+            current = []
+        current.append(idx)
+    if current:
+        batches.append(current)
+    return batches
+
+def _result_for_chunk(raw: Optional[Dict[str, Any]], chunk: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the output record for one chunk from its (possibly shared) raw extraction."""
+    result = finalize_extraction(raw, chunk) if raw is not None else {"doc_id": chunk.get("doc_id", "")}
+    
+    # Ensure aff_hint is included in the result if present in the chunk
+    if "aff_hint" in chunk and chunk["aff_hint"] and isinstance(chunk["aff_hint"], str):
+        result["institution"] = chunk["aff_hint"]
+    
+    return result
+
+def _cache_model_name(model, json_generator=None) -> str:
+    """Model part of the extraction cache key for this decoding setup."""
+    model_name = getattr(model, "name_or_path", MODEL_NAME)
+    if json_generator is not None:
+        # Constrained outputs are kept apart from free-form ones
+        model_name += "+json-schema"
+    elif _is_vllm(model):
+        # Greedy vLLM outputs are kept apart from sampled ones
+        model_name += "+vllm"
+    return model_name
+
+def extract_raw_batch(
+    batch: List[Dict[str, Any]],
+    model,
+    tokenizer,
+    base_prompt: str,
+    debug: bool = False,
+    cache: Optional[ExtractionCache] = None,
+    prefix_cache: Optional[PrefixCache] = None,
+    json_generator=None
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    Run the model over a batch of chunks and return the raw parsed extractions.
+    
+    Args:
+        batch: List of document chunks to process
+        model: Loaded LLM model
+        tokenizer: Tokenizer for the model
+        debug: If True, enable debug logging
+        cache: Optional extraction cache; only cache misses reach the model
+        prefix_cache: Optional KV cache of STATIC_PREFIX from build_prefix_cache
+        json_generator: Optional constrained generator from build_json_generator;
+            replaces free-form generation and JSON parsing
+        
+    Returns:
+        One raw extraction per chunk, or None where the model gave no usable JSON
+    
+    Raises:
+        Whatever generation raised (e.g. CUDA out of memory); a failed batch
+        is left to the caller rather than reported as unparseable chunks
+    """
+    prompts = [format_prompt(chunk, base_prompt) for chunk in batch]
+    
+    # Look the whole batch up at once; hits skip generation entirely
+    keys: List[str] = []
+    raws: List[Optional[Dict[str, Any]]] = [None] * len(batch)
+    if cache is not None:
+        model_name = _cache_model_name(model, json_generator)
+        keys = [cache_key(model_name, prompt) for prompt in prompts]
+        cached = cache.get_many(keys)
+        raws = [cached.get(key) for key in keys]
+        if debug:
+            logger.debug(f"Extraction cache hits: {len(cached)}/{len(batch)}")
+    new_entries: Dict[str, Dict[str, Any]] = {}
+    
+    misses = [i for i, raw in enumerate(raws) if raw is None]
+    
+    # All cache misses go through the model in a single padded generate call
+    if misses:
+        start_time = time.time()
+        miss_prompts = [prompts[i] for i in misses]
+        new_raws: List[Optional[Dict[str, Any]]]
+        if json_generator is not None:
+            new_raws = list(_generate_constrained(miss_prompts, json_generator))
+        elif _is_vllm(model):
+            responses = _generate_vllm(miss_prompts, model)
+            new_raws = [parse_extraction(response, batch[i].get("doc_id", ""))
+                        for i, response in zip(misses, responses)]
+        else:
+            responses = _generate_responses(miss_prompts, model, tokenizer, prefix_cache)
+            new_raws = [parse_extraction(response, batch[i].get("doc_id", ""))
+                        for i, response in zip(misses, responses)]
+        
+        for i, raw in zip(misses, new_raws):
+            raws[i] = raw
+            # Only successful parses are cached so failures are retried next run
+            if raw is not None and cache is not None:
+                new_entries[keys[i]] = raw
+        
+        if debug:
+            logger.debug(f"Generated {len(misses)} extractions in {time.time() - start_time:.2f}s")
+    
+    if cache is not None:
+        cache.put_many(new_entries)
+    
+    return raws
 
-def process_batch(batch: List[Dict[str, Any]], model, tokenizer, base_prompt: str, debug: bool = False) -> List[Dict[str, Any]]:
+def process_batch(
+    batch: List[Dict[str, Any]],
+    model,
+    tokenizer,
+    base_prompt: str,
+    debug: bool = False,
+    cache: Optional[ExtractionCache] = None
+) -> List[Dict[str, Any]]:
     """
     Process a batch of text chunks through the LLM extraction pipeline.
     
@@ -281,6 +745,7 @@ def process_batch(batch: List[Dict[str, Any]], model, tokenizer, base_prompt: st
         model: Loaded LLM model
         tokenizer: Tokenizer for the model
         debug: If True, enable debug logging
+        cache: Optional extraction cache; only cache misses reach the model
         
     Returns:
         List of processed results
@@ -289,59 +754,157 @@ def process_batch(batch: List[Dict[str, Any]], model, tokenizer, base_prompt: st
         logger.info(f"Processing batch of {len(batch)} chunks")
         log_memory_usage()
     
-    results = []
+    raws = extract_raw_batch(batch, model, tokenizer, base_prompt, debug=debug, cache=cache)
+    results = [_result_for_chunk(raw, chunk) for chunk, raw in zip(batch, raws)]
+    
+    if debug:
+        success_count = sum(1 for raw in raws if raw is not None)
+        logger.info(f"Batch completed: {success_count}/{len(batch)} chunks extracted")
+    
+    return results
+
+def _extract_window(
+    window: List[Dict[str, Any]],
+    model,
+    tokenizer,
+    base_prompt: str,
+    batch_size: int,
+    max_batch_tokens: Optional[int],
+    debug: bool = False,
+    cache: Optional[ExtractionCache] = None,
+    prefix_cache: Optional[PrefixCache] = None,
+    json_generator=None,
+    pbar=None,
+    prefilter: Optional[Pattern[str]] = None
+) -> List[Dict[str, Any]]:
+    """Extract one window of corpus chunks; results come back in window order."""
+    # Chunks with no pathogen/biosafety keyword never reach the model
+    relevant = [prefilter is None or prefilter.search(chunk.get("text", "")) is not None for chunk in window]
+    n_skipped = relevant.count(False)
+    if pbar is not None and n_skipped:
+        pbar.update(n_skipped)
+    
+    # Identical chunk texts (shared methods/funding boilerplate) are
+    # extracted once and the result is fanned out to every chunk. Repeats
+    # across windows are served by the extraction cache.
+    hashes = [
+        (chunk.get("chunk_hash") or chunk_hash(chunk.get("text", ""))) if keep else None
+        for chunk, keep in zip(window, relevant)
+    ]
+    groups: Dict[str, List[int]] = {}
+    for idx, h in enumerate(hashes):
+        if h is not None:
+            groups.setdefault(h, []).append(idx)
+    unique_hashes = list(groups)
+    representatives = [window[groups[h][0]] for h in unique_hashes]
+    prompts = [format_prompt(chunk, base_prompt) for chunk in representatives]
+    
+    # Serve cached texts before tokenizing anything, so a re-run only
+    # tokenizes (and buckets) the texts that still need the model
+    raw_by_hash: Dict[str, Optional[Dict[str, Any]]] = {}
+    if cache is not None:
+        model_name = _cache_model_name(model, json_generator)
+        keys = [cache_key(model_name, prompt) for prompt in prompts]
+        cached = cache.get_many(keys)
+        for h, key in zip(unique_hashes, keys):
+            if key in cached:
+                raw_by_hash[h] = cached[key]
+        if pbar is not None and raw_by_hash:
+            pbar.update(sum(len(groups[h]) for h in raw_by_hash))
+    pending = [j for j, h in enumerate(unique_hashes) if h not in raw_by_hash]
+    
+    # Bucket by prompt token length so batches pad to a similar width
+    lengths = _prompt_lengths([prompts[j] for j in pending], tokenizer) if pending else []
+    # Longest batch first, so an out-of-memory batch size fails immediately
+    # instead of at the end of the window
+    batches = [
+        [pending[k] for k in members]
+        for members in plan_batches(lengths, batch_size, max_batch_tokens)[::-1]
+    ]
+    length_of = dict(zip(pending, lengths))
     
-    for i, chunk in enumerate(batch, 1):
-        chunk_id = chunk.get("doc_id", f"chunk-{i}")
+    if debug:
+        logger.info(f"Window: {len(unique_hashes)} unique chunk texts ({len(window)} chunks, "
+                    f"{n_skipped} skipped by prefilter, {len(raw_by_hash)} cached) "
+                    f"in {len(batches)} batches")
+    
+    total_batches = len(batches)
+    
+    for batch_num, members in enumerate(batches, 1):
+        batch_hashes = [unique_hashes[j] for j in members]
+        batch = [representatives[j] for j in members]
         
         if debug:
-            logger.debug(f"Processing {chunk_id}")
-            
+            logger.info(f"\nProcessing batch {batch_num}/{total_batches} "
+                      f"({len(batch)} unique texts, up to {length_of[members[-1]]} prompt tokens)")
+            log_memory_usage()
+        
         try:
-            start_time = time.time()
-            result = extract_from_chunk(chunk, model, tokenizer, base_prompt)
+            batch_start = time.time()
+            raws = extract_raw_batch(batch, model, tokenizer, base_prompt, debug=debug,
+                                     cache=cache, prefix_cache=prefix_cache,
+                                     json_generator=json_generator)
+            raw_by_hash.update(zip(batch_hashes, raws))
             
             if debug:
-                process_time = time.time() - start_time
-                logger.debug(f"Processed {chunk_id} in {process_time:.2f}s")
-            
-            # Ensure aff_hint is included in the result if present in the chunk
-            if "aff_hint" in chunk and chunk["aff_hint"] and isinstance(chunk["aff_hint"], str):
-                # Ensure result is a dictionary before adding the institution field
-                if not isinstance(result, dict):
-                    result = {}
-                result["institution"] = chunk["aff_hint"]
+                batch_time = time.time() - batch_start
+                logger.info(f"Batch {batch_num} completed in {batch_time:.2f}s")
                 
-            # Ensure result has required fields
-            if not isinstance(result, dict):
-                result = {"doc_id": chunk.get("doc_id", "")}
-                
-            results.append(result)
-            
         except Exception as e:
-            logger.error(f"Error processing {chunk_id}: {str(e)}")
+            logger.error(f"Error processing batch {batch_num}: {str(e)}")
             if debug:
-                logger.error(f"Error details for {chunk_id}: {traceback.format_exc()}")
-            
-            # Add an error result for failed chunks
-            results.append({
-                "doc_id": chunk_id,
-                "error": str(e),
-                "success": False
-            })
+                logger.error(f"Batch error details: {traceback.format_exc()}")
+            # Continue with next batch
+            continue
+        
+        if pbar is not None:
+            pbar.update(sum(len(groups[h]) for h in batch_hashes))
     
-    if debug:
-        success_count = sum(1 for r in results if r.get("success", True))
-        logger.info(f"Batch completed: {success_count}/{len(batch)} chunks processed successfully")
+    # Fan out in window order (batches ran in length order, so this is the
+    # inverse permutation); chunks from failed batches are dropped
+    return [
+        _result_for_chunk(raw_by_hash[h], chunk) if h is not None
+        else {"doc_id": chunk.get("doc_id", ""), "skipped": True}
+        for chunk, h in zip(window, hashes)
+        if h is None or h in raw_by_hash
+    ]
+
+def extract_from_chunks(
+    chunks: List[Dict[str, Any]],
+    model,
+    tokenizer,
+    base_prompt: Optional[str] = None,
+    batch_size: int = 16,
+    max_batch_tokens: Optional[int] = None,
+    prefix_cache: Optional[PrefixCache] = None,
+    debug: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Extract information from many chunks with one padded generate() call per batch.
     
-    return results
+    Chunks go through the same dedup/length-bucketing path as process_corpus
+    (without the on-disk cache or keyword prefilter). Results come back in
+    input order; chunks from a batch that failed are omitted.
+    """
+    if base_prompt is None:
+        base_prompt = load_prompt_from_config()
+    return _extract_window(
+        list(chunks), model, tokenizer, base_prompt, batch_size, max_batch_tokens,
+        debug=debug, prefix_cache=prefix_cache
+    )
 
 def process_corpus(
     input_path: Path,
     output_path: Path,
-    batch_size: int = 4,
+    batch_size: int = 8,
     max_chunks: Optional[int] = None,
-    debug: bool = False
+    debug: bool = False,
+    use_cache: bool = True,
+    max_batch_tokens: Optional[int] = None,
+    constrained: bool = False,
+    prefilter: bool = True,
+    backend: str = "transformers",
+    vllm_quantization: Optional[str] = None
 ) -> None:
     """
     Process the corpus file and extract BSL lab information using a local LLM.
@@ -352,11 +915,27 @@ def process_corpus(
         batch_size: Number of chunks to process in each batch
         max_chunks: Maximum number of chunks to process (for testing)
         debug: If True, enable debug logging
+        use_cache: If True, reuse and store extractions in the on-disk cache
+        max_batch_tokens: Padded-token budget per batch (prompt + generation);
+            overrides batch_size so short prompts are batched more densely
+        constrained: If True, decode under the BSLExtraction JSON schema
+            (requires outlines)
+        prefilter: If True, skip chunks matching no pathogen/BSL keyword;
+            they are written as {"doc_id": ..., "skipped": true}
+        backend: "transformers" (HF generate) or "vllm" (requires vllm);
+            with vLLM each window goes to the engine in a single call
+        vllm_quantization: vLLM quantization method (e.g. "fp8", or "awq" for
+            an AWQ checkpoint); ignored by the transformers backend
     """
     logger.info(f"Starting corpus processing: {input_path}")
     start_time = time.time()
+    cache: Optional[ExtractionCache] = None
     
     try:
+        if use_cache:
+            cache = ExtractionCache(DEFAULT_CACHE_PATH)
+            logger.info(f"Using extraction cache at {cache.path}")
+        
         # Log initial memory usage
         if debug:
             log_memory_usage()
@@ -365,65 +944,88 @@ def process_corpus(
         logger.info("Loading extraction prompt from config/prompt.md...")
         base_prompt = load_prompt_from_config()
         
+        if backend == "vllm" and vllm is None:
+            logger.warning("vllm not installed; falling back to the transformers backend")
+            backend = "transformers"
+        
         # Load model and tokenizer
         model_load_start = time.time()
-        logger.info("Loading model and tokenizer...")
-        model, tokenizer = load_model_and_tokenizer(debug=debug)
+        logger.info(f"Loading model and tokenizer ({backend} backend)...")
+        if backend == "vllm":
+            model, tokenizer = load_vllm(quantization=vllm_quantization, debug=debug)
+        else:
+            model, tokenizer = load_model_and_tokenizer(debug=debug)
         logger.info(f"Model and tokenizer loaded in {time.time() - model_load_start:.2f}s")
         
-        # Read the corpus
-        logger.info(f"Reading corpus from {input_path}...")
-        corpus = list(read_jsonl(input_path))
-        
-        if not corpus:
-            logger.warning("No documents found in the corpus")
-            return
+        json_generator = None
+        prefix_cache = None
+        if backend == "vllm":
+            if constrained:
+                logger.warning("Constrained decoding is not supported with vLLM; ignoring")
+        else:
+            warmup_start = time.time()
+            warmup_model(model, tokenizer, base_prompt, batch_size)
+            if debug:
+                logger.info(f"Model warmup finished in {time.time() - warmup_start:.2f}s")
+            
+            json_generator = build_json_generator(model, tokenizer) if constrained else None
             
+            # Prefill the shared instruction/example prefix once for all batches
+            # (free-form generation only)
+            prefix_cache = build_prefix_cache(model, tokenizer) if json_generator is None else None
+            if debug and prefix_cache is not None:
+                logger.info(f"Cached KV for {prefix_cache[0].shape[1]}-token prompt prefix")
+        
+        prefilter_re = build_prefilter() if prefilter else None
+        
+        # Stream the corpus a window at a time; each window is deduplicated,
+        # length-bucketed and written out before the next one is read
+        logger.info(f"Reading corpus from {input_path}...")
+        records = read_jsonl(input_path)
         if max_chunks:
             logger.info(f"Limiting processing to {max_chunks} chunks")
-            corpus = corpus[:max_chunks]
-        
-        logger.info(f"Processing {len(corpus)} chunks in batches of {batch_size}")
+            records = islice(records, max_chunks)
+        window_size = batch_size * WINDOW_BATCHES
         
-        # Process in batches
-        results = []
-        total_chunks = len(corpus)
+        if backend == "vllm":
+            # The engine batches continuously, so it gets each window whole
+            batch_size, max_batch_tokens = window_size, None
+            logger.info(f"Processing {window_size} chunks per vLLM call")
+        elif max_batch_tokens:
+            logger.info(f"Processing in batches of up to {max_batch_tokens} tokens, "
+                        f"{window_size} chunks read at a time")
+        else:
+            logger.info(f"Processing in batches of {batch_size}, {window_size} chunks read at a time")
         
-        with tqdm(total=total_chunks, desc="Processing chunks") as pbar:
-            for i in range(0, total_chunks, batch_size):
-                batch = corpus[i:i + batch_size]
-                batch_num = (i // batch_size) + 1
-                total_batches = (total_chunks + batch_size - 1) // batch_size
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        n_chunks = n_results = 0
+        with open(output_path, 'wb', buffering=WRITE_BUFFER_SIZE) as f, \
+                tqdm(total=max_chunks or None, desc="Processing chunks", unit="chunk") as pbar:
+            while True:
+                window = list(islice(records, window_size))
+                if not window:
+                    break
+                n_chunks += len(window)
+                
+                results = _extract_window(
+                    window, model, tokenizer, base_prompt, batch_size, max_batch_tokens,
+                    debug=debug, cache=cache, prefix_cache=prefix_cache,
+                    json_generator=json_generator, pbar=pbar, prefilter=prefilter_re
+                )
+                for result in results:
+                    f.write(dumps_line(result))
+                # Completed windows survive a crash later in the run
+                f.flush()
+                n_results += len(results)
                 
                 if debug:
-                    logger.info(f"\nProcessing batch {batch_num}/{total_batches} "
-                              f"(chunks {i+1}-{min(i+batch_size, total_chunks)}/{total_chunks})")
+                    logger.info(f"Wrote {n_results} results so far")
                     log_memory_usage()
-                
-                try:
-                    batch_start = time.time()
-                    batch_results = process_batch(batch, model, tokenizer, base_prompt, debug=debug)
-                    results.extend(batch_results)
-                    
-                    if debug:
-                        batch_time = time.time() - batch_start
-                        logger.info(f"Batch {batch_num} completed in {batch_time:.2f}s")
-                        logger.info(f"Current results count: {len(results)}")
-                        
-                except Exception as e:
-                    logger.error(f"Error processing batch {batch_num}: {str(e)}")
-                    if debug:
-                        logger.error(f"Batch error details: {traceback.format_exc()}")
-                    # Continue with next batch
-                    continue
-                    
-                pbar.update(len(batch))
-        
-        # Write results
-        logger.info(f"Writing {len(results)} results to {output_path}")
-        with open(output_path, 'w') as f:
-            for result in results:
-                f.write(json.dumps(result) + '\n')
+        
+        if not n_chunks:
+            logger.warning("No documents found in the corpus")
+            return
+        logger.info(f"Wrote {n_results} results for {n_chunks} chunks to {output_path}")
         
         logger.info(f"Processing completed in {time.time() - start_time:.2f} seconds")
         
@@ -432,5 +1034,8 @@ def process_corpus(
         if debug:
             logger.error(f"Error details: {traceback.format_exc()}")
         raise
+    finally:
+        if cache is not None:
+            cache.close()
     
     print(f"Saved extractions to {output_path}")
@@ -0,0 +1,28 @@
+"""SQLite-backed cache of raw LLM extraction results."""
+
+import hashlib
+from pathlib import Path
+
+from bslmap.sqlite_cache import JsonCache
+
+DEFAULT_CACHE_PATH = Path(__file__).parent.parent.parent / "data" / "cache" / "extractions.sqlite"
+
+
+def cache_key(model_name: str, prompt: str) -> str:
+    """Key an extraction by model and the exact prompt it was generated from.
+
+    The prompt embeds both the chunk text and the prompt template, so editing
+    either one invalidates the affected entries.
+    """
+    return hashlib.sha256(f"{model_name}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+class ExtractionCache(JsonCache):
+    """Persistent map from cache_key() to the model's parsed JSON output.
+
+    Only raw model output is stored; chunk-specific fields (doc_id, source
+    PMID, institution hint) are applied after lookup.
+    """
+
+    def __init__(self, path: Path = DEFAULT_CACHE_PATH):
+        super().__init__(path, "extractions")
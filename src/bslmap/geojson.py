@@ -1,51 +1,64 @@
-import csv
-import json
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Any, Dict, Iterator
+import pandas as pd
 from tqdm import tqdm
+from bslmap.io_utils import WRITE_BUFFER_SIZE, dumps
+
+# Evidence PMIDs listed per lab feature
+MAX_EVIDENCE_PMIDS = 50
 
 def build_geojson(labs_csv: Path, evidence_csv: Path, out_geojson: Path) -> None:
     print("Building GeoJSON from labs and evidence data...")
     
     # naive join by institution (improve later with alias table)
-    ev_by_inst: Dict[str, List[Dict[str, Any]]] = {}
-    
     print("Loading evidence data...")
-    with evidence_csv.open() as f:
-        r = csv.DictReader(f)
-        evidence_rows = list(r)
-        
-    with tqdm(total=len(evidence_rows), desc="Indexing evidence", unit="row") as pbar:
-        for row in evidence_rows:
-            ev_by_inst.setdefault(row["institution"], []).append(row)
-            pbar.update(1)
-
+    evidence = pd.read_csv(evidence_csv, dtype=str, keep_default_na=False)
+    
+    # Aggregate evidence per institution in one grouped pass instead of a
+    # Python list per institution
+    ev_by_inst = evidence.groupby("institution", sort=False)["pmid"].agg(
+        evidence_count="size",
+        evidence_pmids=lambda pmids: pmids.head(MAX_EVIDENCE_PMIDS).tolist(),
+    )
+    
     print(f"\nProcessing labs data...")
-    features = []
-    with labs_csv.open() as f:
-        r = csv.DictReader(f)
-        labs_rows = list(r)
-        
-    with tqdm(total=len(labs_rows), desc="Building GeoJSON features", unit="lab") as pbar:
-        for lab in labs_rows:
-            ev = ev_by_inst.get(lab["institution"], [])
-            features.append({
+    labs = pd.read_csv(labs_csv, dtype=str, keep_default_na=False)
+    lab_columns = list(labs.columns)
+    labs = labs.merge(ev_by_inst, left_on="institution", right_index=True, how="left")
+    labs["evidence_count"] = labs["evidence_count"].fillna(0).astype(int)
+    labs["evidence_pmids"] = [p if isinstance(p, list) else [] for p in labs["evidence_pmids"]]
+    
+    # Parse coordinates column-wise with pandas' C parser; the string
+    # columns stay untouched for the feature properties
+    lons = pd.to_numeric(labs["longitude"]).astype(float).tolist()
+    lats = pd.to_numeric(labs["latitude"]).astype(float).tolist()
+    
+    def _features() -> Iterator[Dict[str, Any]]:
+        for lab, lon, lat in zip(labs.to_dict("records"), lons, lats):
+            yield {
                 "type": "Feature",
                 "properties": {
-                    **lab,
-                    "evidence_count": len(ev),
-                    "evidence_pmids": [e["pmid"] for e in ev][:50],
+                    **{col: lab[col] for col in lab_columns},
+                    "evidence_count": lab["evidence_count"],
+                    "evidence_pmids": lab["evidence_pmids"],
                 },
                 "geometry": {
                     "type":"Point",
-                    "coordinates":[float(lab["longitude"]), float(lab["latitude"])]
+                    "coordinates":[lon, lat]
                 }
-            })
-            if ev:
-                pbar.set_postfix_str(f"Evidence: {len(ev)} records")
-            pbar.update(1)
+            }
     
-    print(f"\nWriting GeoJSON with {len(features)} features...")
-    geojson_data = {"type":"FeatureCollection","features":features}
-    out_geojson.write_text(json.dumps(geojson_data, indent=2), encoding="utf-8")
-    print(f"GeoJSON building completed. Output: {out_geojson}")
\ No newline at end of file
+    # Stream the FeatureCollection one feature per line instead of building
+    # and indenting the whole document in memory
+    print(f"\nWriting GeoJSON with {len(labs)} features...")
+    out_geojson.parent.mkdir(parents=True, exist_ok=True)
+    with out_geojson.open("wb", buffering=WRITE_BUFFER_SIZE) as f, \
+            tqdm(total=len(labs), desc="Writing GeoJSON features", unit="lab") as pbar:
+        f.write(b'{"type":"FeatureCollection","features":[\n')
+        sep = b""
+        for feature in _features():
+            f.write(sep + dumps(feature))
+            sep = b",\n"
+            pbar.update(1)
+        f.write(b"\n]}\n")
+    print(f"GeoJSON building completed. Output: {out_geojson}")
@@ -1,7 +1,9 @@
 import os
 import sys
-import time
 import json
+import asyncio
+import logging
+import importlib.util
 import httpx
 from typing import List, Dict, Optional, Any
 from dataclasses import dataclass
@@ -18,6 +20,7 @@ except ImportError:
 class Settings:
     def __init__(self, **kwargs):
         self.europe_pmc_cc_by_only = kwargs.get('europe_pmc_cc_by_only', False)
+        self.europe_pmc_requests_per_second = kwargs.get('europe_pmc_requests_per_second', 2.0)
 
 # Try to import the real settings
 try:
@@ -26,31 +29,42 @@ try:
 except ImportError:
     pass
 
-def _links_for_pmid(pmid: str) -> List[Dict]:
-    print(f"\n[DEBUG] _links_for_pmid called with PMID: {pmid}")
+from bslmap.sqlite_cache import JsonCache
+from bslmap.ratelimit import AsyncRateLimiter
+
+# Unfiltered Europe PMC links per PMID; the CC-BY filter is applied after lookup
+DEFAULT_LINKS_CACHE_PATH = Path(__file__).parent.parent.parent / "data" / "cache" / "eupmc_links.sqlite"
+
+logger = logging.getLogger(__name__)
+
+# Requests in flight at once, and the default overall request rate they
+# share (Settings.europe_pmc_requests_per_second overrides it)
+MAX_CONCURRENCY = 8
+REQUESTS_PER_SECOND = 2.0
+
+# HTTP/2 needs the optional h2 package (httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+async def _links_for_pmid(client: httpx.AsyncClient, pmid: str) -> Optional[List[Dict]]:
+    """Full-text links for one PMID; None if the request failed (never cached)."""
     try:
         url = "https://www.ebi.ac.uk/europepmc/webservices/rest/search"
         query = f"EXT_ID:{pmid} AND SRC:MED"
         params = {"query": query, "resultType": "core", "format": "json"}
         
-        # Print request details for debugging
-        print(f"\n🔍 Querying Europe PMC for PMID: {pmid}")
-        print(f"   URL: {url}")
-        print(f"   Query: {query}")
+        logger.debug("Querying Europe PMC for PMID %s: %s (query: %s)", pmid, url, query)
         
         # Make the request with a timeout
-        response = httpx.get(url, params=params, timeout=30.0)
+        response = await client.get(url, params=params)
         response.raise_for_status()
         
         data = response.json()
         hits = data.get("resultList", {}).get("result", [])
-        print(f"   Found {len(hits)} hits")
+        logger.debug("PMID %s: %d hits", pmid, len(hits))
         
         links = []
         for hit in hits:
             urls = hit.get("fullTextUrlList", {}).get("fullTextUrl", [])
-            print(f"   Processing {len(urls)} URLs")
-            
             for ll in urls:
                 link_data = {
                     "pmid": pmid,
@@ -61,23 +75,19 @@ def _links_for_pmid(pmid: str) -> List[Dict]:
                     "hit_title": hit.get("title", "")[:50] + "..." if hit.get("title") else ""
                 }
                 links.append(link_data)
-                print(f"   ✓ Found: {link_data['url']} ({link_data['type']})")
+                logger.debug("PMID %s: found %s (%s)", pmid, link_data["url"], link_data["type"])
         
         return links
     except Exception as e:
-        print(f"❌ Error processing PMID {pmid}: {str(e)}")
+        logger.warning("Error processing PMID %s: %s", pmid, e)
         if 'response' in locals():
-            print(f"   Status code: {response.status_code}")
-            print(f"   Response: {response.text[:200]}...")
-        return []
+            logger.debug("PMID %s: status %s, response: %s...", pmid, response.status_code, response.text[:200])
+        return None
 
-def links_for_pmids(pmids: List[str], cfg: Settings):
-    print("\n[DEBUG] links_for_pmids called")
-    print(f"[DEBUG] Number of PMIDs: {len(pmids)}")
-    print(f"[DEBUG] First 5 PMIDs: {pmids[:5]}")
+def links_for_pmids(pmids: List[str], cfg: Settings, use_cache: bool = True):
+    logger.debug("links_for_pmids: %d PMIDs, first 5: %s", len(pmids), pmids[:5])
     out = []
     total_pmids = len(pmids)
-    print("[DEBUG] Starting processing...")
     
     # Print configuration
     print("\n" + "="*60)
@@ -85,6 +95,8 @@ def links_for_pmids(pmids: List[str], cfg: Settings):
     print("="*60)
     print(f"Total PMIDs to process: {total_pmids:,}")
     print(f"CC-BY only: {getattr(cfg, 'europe_pmc_cc_by_only', False)}")
+    requests_per_second = getattr(cfg, 'europe_pmc_requests_per_second', REQUESTS_PER_SECOND)
+    print(f"Rate limit: {requests_per_second:g} requests/second")
     print(f"Environment: Python {sys.version.split()[0]}")
     print(f"Working directory: {os.getcwd()}")
     print("="*60 + "\n")
@@ -105,51 +117,81 @@ def links_for_pmids(pmids: List[str], cfg: Settings):
         progress_bar = None
         USE_TQDM = False
     
-    try:
-        for i, pmid in enumerate(pmids, 1):
+    cc_by_only = getattr(cfg, 'europe_pmc_cc_by_only', False)
+    # One slot per PMID, filled as requests complete, so an interrupted run
+    # still returns everything fetched so far in input order
+    results: List[Optional[List[Dict]]] = [None] * total_pmids
+    completed = [0]
+    pmids = [str(pmid).strip() for pmid in pmids]
+    
+    # PMIDs seen in earlier runs are answered from the on-disk cache; only
+    # successful responses fetched in this run are added to it
+    cache = JsonCache(DEFAULT_LINKS_CACHE_PATH, "eupmc_links") if use_cache else None
+    cached: Dict[str, List[Dict]] = cache.get_many(pmids) if cache is not None else {}
+    fetched: Dict[str, List[Dict]] = {}
+    if cached:
+        print(f"Links cache: {len(cached):,} of {total_pmids:,} PMIDs already fetched")
+    
+    def _record(i: int, pmid: str, links: List[Dict]) -> None:
+        # Filter for CC-BY if needed
+        if cc_by_only:
+            links = [x for x in links if x.get("license", "").upper().startswith("CC-BY")]
+        results[i] = links
+        
+        # Log results
+        if links:
+            logger.debug("Found %d links for PMID %s%s", len(links), pmid, " (CC-BY only)" if cc_by_only else "")
+        
+        # Update progress
+        completed[0] += 1
+        if USE_TQDM:
+            progress_bar.update(1)
+        elif completed[0] % 100 == 0 or completed[0] == total_pmids:
+            logger.info("Processed %d/%d PMIDs", completed[0], total_pmids)
+    
+    async def _fetch(i: int, pmid: str, client: httpx.AsyncClient,
+                     sem: asyncio.Semaphore, limiter: AsyncRateLimiter) -> None:
+        async with sem:
+            await limiter.wait()
             try:
-                if USE_TQDM:
-                    progress_bar.set_postfix_str(f"PMID: {pmid}")
-                else:
-                    print(f"\n[{i}/{total_pmids}] Processing PMID: {pmid}")
-                
-                # Process the PMID
-                links = _links_for_pmid(str(pmid).strip())
-                
-                # Filter for CC-BY if needed
-                if getattr(cfg, 'europe_pmc_cc_by_only', False):
-                    links = [x for x in links if x.get("license", "").upper().startswith("CC-BY")]
-                
-                # Add to results
-                out.extend(links)
-                
-                # Log results
-                if links:
-                    msg = f"✅ Found {len(links)} links for PMID {pmid}"
-                    if getattr(cfg, 'europe_pmc_cc_by_only', False):
-                        msg += " (CC-BY only)"
-                    print(msg)
-                
-                # Update progress
-                if USE_TQDM:
-                    progress_bar.update(1)
-                
-                # Rate limiting
-                if i < total_pmids:
-                    time.sleep(0.5)  # 2 requests per second max
-                    
-            except KeyboardInterrupt:
-                print("\n⚠️ User interrupted. Saving current progress...")
-                break
+                links = await _links_for_pmid(client, pmid)
             except Exception as e:
-                print(f"❌ Error processing PMID {pmid}: {str(e)}")
-                if USE_TQDM:
-                    progress_bar.update(1)
-                continue
-                
+                logger.warning("Error processing PMID %s: %s", pmid, e)
+                links = None
+        if links is not None:
+            fetched[pmid] = links
+        _record(i, pmid, links or [])
+    
+    async def _fetch_all() -> None:
+        sem = asyncio.Semaphore(MAX_CONCURRENCY)
+        limiter = AsyncRateLimiter(requests_per_second)
+        # One pooled client for the whole run; connections are kept alive
+        # and reused by every request
+        limits = httpx.Limits(max_keepalive_connections=MAX_CONCURRENCY, max_connections=MAX_CONCURRENCY)
+        async with httpx.AsyncClient(http2=HTTP2_AVAILABLE, timeout=30.0, limits=limits) as client:
+            await asyncio.gather(*[
+                _fetch(i, pmid, client, sem, limiter)
+                for i, pmid in enumerate(pmids)
+                if pmid not in cached
+            ])
+    
+    try:
+        for i, pmid in enumerate(pmids):
+            if pmid in cached:
+                _record(i, pmid, cached[pmid])
+        asyncio.run(_fetch_all())
+    except KeyboardInterrupt:
+        print("\n⚠️ User interrupted. Saving current progress...")
     finally:
         if USE_TQDM:
             progress_bar.close()
+        if cache is not None:
+            cache.put_many(fetched)
+            cache.close()
+    
+    for links in results:
+        if links:
+            out.extend(links)
     
     print("\n" + "="*60)
     print(f"PROCESSING COMPLETE".center(60))
@@ -1,87 +1,156 @@
+import importlib.util
+import io
 import re
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
 
 import httpx
-from typing import List, Dict, Any
+
+try:
+    from lxml import etree
+except ImportError:  # fall back to regex parsing of the efetch XML
+    etree = None
 from tqdm import tqdm
+
 from bslmap.cfg import Settings
+from bslmap.ratelimit import RateLimiter
 
 BASE = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
 
+# One keep-alive client for all E-utilities calls, so each request reuses an
+# open connection instead of paying a new TCP+TLS handshake. HTTP/2 needs the
+# optional h2 package (httpx[http2]).
+_CLIENT = httpx.Client(
+    http2=importlib.util.find_spec("h2") is not None,
+    timeout=60.0,
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=20),
+)
+
+# NCBI allows 3 requests/second without an API key, shared by all threads
+NCBI_REQUESTS_PER_SECOND = 3.0
+_NCBI_LIMITER = RateLimiter(NCBI_REQUESTS_PER_SECOND)
+
+# Institutions harvested concurrently by search_pubmed
+MAX_WORKERS = 8
+
+def _get(url: str, **kwargs: Any) -> httpx.Response:
+    _NCBI_LIMITER.wait()
+    return _CLIENT.get(url, **kwargs)
+
+def _post(url: str, **kwargs: Any) -> httpx.Response:
+    _NCBI_LIMITER.wait()
+    return _CLIENT.post(url, **kwargs)
+
+# Record elements in efetch XML; book chapters carry abstracts too
+_ARTICLE_TAGS = ("PubmedArticle", "PubmedBookArticle")
+
+# Patterns for the regex fallback parser and abstract whitespace cleanup
+_ARTICLE_END_RE = re.compile(r"</PubmedArticle>")
+_PMID_RE = re.compile(r"<PMID[^>]*>(\d+)</PMID>")
+_ABSTXT_RE = re.compile(r"<AbstractText[^>]*>(.*?)</AbstractText>", re.S | re.M)
+_TAG_RE = re.compile(r"<[^>]+>")
+_WS_RE = re.compile(r"\s+")
+_WEBENV_RE = re.compile(r"<WebEnv>\s*([^<\s]+)\s*</WebEnv>")
+_QUERY_KEY_RE = re.compile(r"<QueryKey>\s*(\d+)\s*</QueryKey>")
+
+# Ids per esummary/efetch page when reading from the history server
+EUTILS_BATCH = 500
+
+# (WebEnv, query_key) naming an id list posted to the NCBI history server
+History = Tuple[str, str]
+
 def _esearch(q: str, email: str, retmax: int) -> List[str]:
     params = {"db":"pubmed","term": q,"retmode":"json","retmax": retmax,"email": email}
-    r = httpx.get(f"{BASE}/esearch.fcgi", params=params, timeout=30)
+    r = _get(f"{BASE}/esearch.fcgi", params=params, timeout=30)
     r.raise_for_status()
     return r.json().get("esearchresult", {}).get("idlist", [])
 
-def _esummary(ids: List[str], email: str) -> Dict[str, Any]:
+def _epost(ids: List[str], email: str) -> History:
+    """Upload ids to the NCBI history server; returns (WebEnv, query_key)."""
+    r = _post(f"{BASE}/epost.fcgi", data={"db":"pubmed","id":",".join(ids),"email": email}, timeout=30)
+    r.raise_for_status()
+    m_env = _WEBENV_RE.search(r.text)
+    m_key = _QUERY_KEY_RE.search(r.text)
+    if not (m_env and m_key):
+        raise RuntimeError(f"epost returned no WebEnv/QueryKey: {r.text[:200]}")
+    return m_env.group(1), m_key.group(1)
+
+def _history_params(history: History, retstart: int, email: str) -> Dict[str, Any]:
+    webenv, query_key = history
+    return {"db":"pubmed","WebEnv": webenv,"query_key": query_key,
+            "retstart": retstart,"retmax": EUTILS_BATCH,"email": email}
+
+def _esummary(ids: List[str], email: str, history: Optional[History] = None) -> Dict[str, Any]:
     if not ids:
         return {}
     
-    # Batch requests to avoid URI too long errors
-    batch_size = 200  # Conservative batch size
+    # Page through the posted id list instead of sending ids in the URL
+    if history is None:
+        history = _epost(ids, email)
     all_results = {"result": {"uids": []}}
     
-    num_batches = (len(ids) + batch_size - 1) // batch_size
-    with tqdm(total=num_batches, desc="Fetching summaries", unit="batch") as pbar:
-        for i in range(0, len(ids), batch_size):
-            batch_ids = ids[i:i + batch_size]
-            params = {"db":"pubmed","id":",".join(batch_ids),"retmode":"json","email": email}
-            r = httpx.get(f"{BASE}/esummary.fcgi", params=params, timeout=30)
-            r.raise_for_status()
-            batch_result = r.json()
-            
-            # Merge results
-            if "result" in batch_result:
-                all_results["result"]["uids"].extend(batch_result["result"].get("uids", []))
-                for uid in batch_result["result"].get("uids", []):
-                    if uid in batch_result["result"]:
-                        all_results["result"][uid] = batch_result["result"][uid]
-            
-            pbar.update(1)
-            
-            # Rate limiting between batches
-            if i + batch_size < len(ids):
-                time.sleep(0.34)
+    for i in range(0, len(ids), EUTILS_BATCH):
+        params = {**_history_params(history, i, email), "retmode":"json"}
+        r = _get(f"{BASE}/esummary.fcgi", params=params, timeout=30)
+        r.raise_for_status()
+        batch_result = r.json()
+        
+        # Merge results
+        if "result" in batch_result:
+            all_results["result"]["uids"].extend(batch_result["result"].get("uids", []))
+            for uid in batch_result["result"].get("uids", []):
+                if uid in batch_result["result"]:
+                    all_results["result"][uid] = batch_result["result"][uid]
     
     return all_results
 
-def _efetch_abs(ids: List[str], email: str) -> str:
+def _efetch_abs(ids: List[str], email: str, history: Optional[History] = None) -> List[bytes]:
+    """Fetch PubMed XML for ids, one raw response body per EUTILS_BATCH ids."""
     if not ids:
-        return ""
+        return []
     
-    # Batch requests to avoid URI too long errors
-    batch_size = 200  # Conservative batch size
+    # Page through the posted id list instead of sending ids in the URL
+    if history is None:
+        history = _epost(ids, email)
     all_xml = []
     
-    num_batches = (len(ids) + batch_size - 1) // batch_size
-    with tqdm(total=num_batches, desc="Fetching abstracts", unit="batch") as pbar:
-        for i in range(0, len(ids), batch_size):
-            batch_ids = ids[i:i + batch_size]
-            params = {"db":"pubmed","id":",".join(batch_ids),"retmode":"xml","email": email}
-            r = httpx.get(f"{BASE}/efetch.fcgi", params=params, timeout=60)
-            r.raise_for_status()
-            all_xml.append(r.text)
-            
-            pbar.update(1)
-            
-            # Rate limiting between batches
-            if i + batch_size < len(ids):
-                time.sleep(0.34)
+    for i in range(0, len(ids), EUTILS_BATCH):
+        params = {**_history_params(history, i, email), "retmode":"xml"}
+        r = _get(f"{BASE}/efetch.fcgi", params=params, timeout=60)
+        r.raise_for_status()
+        all_xml.append(r.content)
     
-    return "\n".join(all_xml)
+    return all_xml
 
-def _parse_abs(xml_text: str) -> Dict[str,str]:
-    blocks = re.split(r"</PubmedArticle>", xml_text)
+def _parse_abs(xml_chunks: List[bytes]) -> Dict[str,str]:
+    """Map PMID -> whitespace-normalized abstract text."""
+    if etree is None:
+        return _parse_abs_regex(b"\n".join(xml_chunks).decode("utf-8", errors="replace"))
+    out = {}
+    for xml_chunk in xml_chunks:
+        # Stream one article (journal or book) at a time and free it once read;
+        # the record's own PMID precedes any cited PMIDs
+        for _, elem in etree.iterparse(io.BytesIO(xml_chunk), tag=_ARTICLE_TAGS):
+            pmid = elem.findtext(".//PMID")
+            if pmid:
+                txt = " ".join("".join(t.itertext()) for t in elem.iterfind(".//AbstractText"))
+                out[pmid.strip()] = _WS_RE.sub(" ", txt).strip()
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+    return out
+
+def _parse_abs_regex(xml_text: str) -> Dict[str,str]:
+    blocks = _ARTICLE_END_RE.split(xml_text)
     out = {}
     for b in blocks:
-        m_id = re.search(r"<PMID[^>]*>(\d+)</PMID>", b)
+        m_id = _PMID_RE.search(b)
         if not m_id:
             continue
         pmid = m_id.group(1)
-        texts = re.findall(r"<AbstractText[^>]*>(.*?)</AbstractText>", b, flags=re.S|re.M)
-        txt = re.sub(r"<[^>]+>", " ", " ".join(texts))
-        out[pmid] = re.sub(r"\s+"," ",txt).strip()
+        texts = _ABSTXT_RE.findall(b)
+        txt = _TAG_RE.sub(" ", " ".join(texts))
+        out[pmid] = _WS_RE.sub(" ", txt).strip()
     return out
 
 def _build_query(inst: str, kws: List[str], since: int) -> str:
@@ -90,33 +159,43 @@ def _build_query(inst: str, kws: List[str], since: int) -> str:
     date = f'("{since}"[PDAT] : "3000"[PDAT])'
     return f'({aff}) AND ({kw}) AND {date}'
 
-def search_pubmed(institutions: List[str], keywords: List[str], cfg: Settings) -> List[Dict[str, Any]]:
+def _harvest_one(inst: str, keywords: List[str], cfg: Settings) -> List[Dict[str, Any]]:
+    """Search, summarize and fetch abstracts for one institution."""
+    q = _build_query(inst, keywords, cfg.since_year)
+    pmids = _esearch(q, cfg.email_for_ncbi, cfg.max_per_institution)
+    
+    # Post the ids once; summaries and abstracts both page through it
+    history = _epost(pmids, cfg.email_for_ncbi) if pmids else None
+    meta = _esummary(pmids, cfg.email_for_ncbi, history)
+    xml = _efetch_abs(pmids, cfg.email_for_ncbi, history)
+    abs_map = _parse_abs(xml)
+    
     out = []
+    uids = meta.get("result", {}).get("uids", [])
+    for uid in uids:
+        rec = meta["result"].get(uid, {})
+        rec["pmid"] = uid
+        rec["abstract"] = abs_map.get(uid, "")
+        rec["institution_query"] = inst
+        out.append(rec)
+    return out
+
+def search_pubmed(institutions: List[str], keywords: List[str], cfg: Settings) -> List[Dict[str, Any]]:
     print(f"Searching PubMed for {len(institutions)} institutions...")
     
-    with tqdm(total=len(institutions), desc="Processing institutions", unit="inst") as pbar:
-        for inst in institutions:
-            pbar.set_postfix_str(f"Current: {inst[:50]}..." if len(inst) > 50 else inst)
-            
-            q = _build_query(inst, keywords, cfg.since_year)
-            pmids = _esearch(q, cfg.email_for_ncbi, cfg.max_per_institution)
-            pbar.write(f"Found {len(pmids)} PMIDs for {inst}")
-            
-            time.sleep(0.34)
-            meta = _esummary(pmids, cfg.email_for_ncbi)
-            time.sleep(0.34)
-            xml = _efetch_abs(pmids, cfg.email_for_ncbi)
-            abs_map = _parse_abs(xml)
-
-            uids = meta.get("result", {}).get("uids", [])
-            for uid in uids:
-                rec = meta["result"].get(uid, {})
-                rec["pmid"] = uid
-                rec["abstract"] = abs_map.get(uid, "")
-                rec["institution_query"] = inst
-                out.append(rec)
-            
+    # Institutions are independent, so several are harvested at once; the
+    # shared limiter keeps the combined request rate within NCBI's limit
+    records: Dict[str, List[Dict[str, Any]]] = {}
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex, \
+            tqdm(total=len(institutions), desc="Processing institutions", unit="inst") as pbar:
+        futures = {ex.submit(_harvest_one, inst, keywords, cfg): inst for inst in institutions}
+        for f in as_completed(futures):
+            inst = futures[f]
+            records[inst] = f.result()
+            pbar.write(f"Found {len(records[inst])} records for {inst}")
             pbar.update(1)
     
+    # Keep the output in input institution order
+    out = [rec for inst in institutions for rec in records.get(inst, [])]
     print(f"\nCompleted PubMed search. Total records: {len(out)}")
-    return out
\ No newline at end of file
+    return out
@@ -1,21 +1,94 @@
 # src/bslmap/io_utils.py
 from __future__ import annotations
-import json, os, tempfile
+import json, mmap, os, tempfile
 from pathlib import Path
-from typing import Iterable, Dict, Any, Iterator
+from typing import BinaryIO, Iterable, Dict, Any, Iterator, Union
 
-def write_jsonl(path: Path, rows: Iterable[Dict[str, Any]]) -> None:
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib codec
+    orjson = None  # type: ignore[assignment]
+
+# Large buffers keep the JSONL hot path in the (de)serializer, not in syscalls.
+READ_BUFFER_SIZE = 8 << 20  # 8 MiB
+# Lines are appended to the BufferedWriter's own buffer, so output reaches the
+# OS in 4 MiB writes without an extra staging buffer.
+WRITE_BUFFER_SIZE = 4 << 20  # 4 MiB
+
+if orjson is not None:
+    def dumps_line(obj: Any) -> bytes:
+        """Serialize one record as a UTF-8 JSON line (newline included)."""
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+
+    loads_line = orjson.loads
+else:
+    def dumps_line(obj: Any) -> bytes:
+        """Serialize one record as a UTF-8 JSON line (newline included)."""
+        return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+
+    def loads_line(line: Union[bytes, str]) -> Any:
+        return json.loads(line)
+
+if orjson is not None:
+    def dumps(obj: Any) -> bytes:
+        """Serialize one value as compact UTF-8 JSON (no trailing newline)."""
+        return orjson.dumps(obj)
+else:
+    def dumps(obj: Any) -> bytes:
+        """Serialize one value as compact UTF-8 JSON (no trailing newline)."""
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def write_jsonl(path: Path, rows: Iterable[Dict[str, Any]]) -> int:
+    """Write rows (any iterable, consumed lazily) as JSONL; returns the row count."""
     path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("w", encoding="utf-8") as f:
+    n = 0
+    with path.open("wb", buffering=WRITE_BUFFER_SIZE) as f:
         for r in rows:
-            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+            f.write(dumps_line(r))
+            n += 1
+    return n
 
-def read_jsonl(path: Path) -> Iterator[Dict[str, Any]]:
-    with path.open("r", encoding="utf-8") as f:
-        for line in f:
+def _read_jsonl_stream(f: BinaryIO) -> Iterator[Dict[str, Any]]:
+    tail = b""
+    while True:
+        block = f.read(READ_BUFFER_SIZE)
+        if not block:
+            break
+        lines = (tail + block).split(b"\n")
+        tail = lines.pop()
+        for line in lines:
             line = line.strip()
             if line:
-                yield json.loads(line)
+                yield loads_line(line)
+    tail = tail.strip()
+    if tail:
+        yield loads_line(tail)
+
+def read_jsonl(path: Path) -> Iterator[Dict[str, Any]]:
+    """Stream records from a JSONL file through a read-only memory map.
+    
+    Lines are located with ``mm.find(b"\\n")`` and parsed straight from the
+    mapped bytes; blank lines are skipped. Files that cannot be mapped (empty
+    files, pipes) are read in fixed-size binary blocks instead.
+    """
+    with path.open("rb", buffering=0) as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            yield from _read_jsonl_stream(f)
+            return
+        with mm:
+            find = mm.find
+            end = len(mm)
+            pos = 0
+            while pos < end:
+                nl = find(b"\n", pos)
+                if nl == -1:
+                    nl = end
+                line = mm[pos:nl].strip()
+                if line:
+                    yield loads_line(line)
+                pos = nl + 1
 
 def atomic_write_jsonl(path: Path, rows: Iterable[Dict[str, Any]]) -> None:
     """Write JSONL atomically to avoid partial files."""
@@ -24,11 +97,11 @@ def atomic_write_jsonl(path: Path, rows: Iterable[Dict[str, Any]]) -> None:
     os.close(fd)
     tmp_path = Path(tmp)
     try:
-        with tmp_path.open("w", encoding="utf-8") as f:
+        with tmp_path.open("wb", buffering=WRITE_BUFFER_SIZE) as f:
             for r in rows:
-                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+                f.write(dumps_line(r))
         tmp_path.replace(path)
     finally:
         if tmp_path.exists():
             try: tmp_path.unlink()
-            except OSError: pass
\ No newline at end of file
+            except OSError: pass
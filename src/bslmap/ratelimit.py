@@ -0,0 +1,43 @@
+"""Request pacing shared by the harvesters."""
+
+import asyncio
+import threading
+import time
+
+
+class RateLimiter:
+    """Space calls to wait() at least 1/rate seconds apart across all threads.
+
+    Only the time remaining until the next free slot is slept, so a slow
+    response does not also pay a fixed delay afterwards.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class AsyncRateLimiter:
+    """asyncio counterpart of RateLimiter: spaces request starts across tasks."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
@@ -0,0 +1,55 @@
+"""Generic SQLite-backed cache of JSON values keyed by strings."""
+
+import json
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+
+# Stay well below SQLite's bound-parameter limit in batched lookups
+_LOOKUP_BATCH = 500
+
+
+class JsonCache:
+    """Persistent map from string keys to JSON values, kept in one SQLite table."""
+
+    def __init__(self, path: Path, table: str):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.table = table
+        self._conn = sqlite3.connect(str(path))
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, result TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Look up several keys at once; missing keys are absent from the result."""
+        unique: List[str] = list(dict.fromkeys(keys))
+        found: Dict[str, Any] = {}
+        for i in range(0, len(unique), _LOOKUP_BATCH):
+            batch = unique[i:i + _LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT key, result FROM {self.table} WHERE key IN ({placeholders})", batch
+            )
+            for key, result in rows:
+                found[key] = json.loads(result)
+        return found
+
+    def put_many(self, results: Dict[str, Any]) -> None:
+        if not results:
+            return
+        self._conn.executemany(
+            f"INSERT OR REPLACE INTO {self.table} (key, result) VALUES (?, ?)",
+            [(key, json.dumps(result, ensure_ascii=False)) for key, result in results.items()],
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> "JsonCache":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
@@ -3,38 +3,59 @@
 
 import json
 import sys
+import time
 from pathlib import Path
 
 # Add src to path
 sys.path.insert(0, str(Path(__file__).parent / "src"))
 
-from bslmap.extract_with_llm import load_model_and_tokenizer, extract_from_chunk
+from bslmap.extract_with_llm import load_model_and_tokenizer, load_vllm, extract_from_chunks
 
-def test_single_chunk():
-    """Test extraction on a single chunk."""
-    
-    # Sample chunk from the corpus
-    test_chunk = {
-        "doc_id": "pmid:40924481#chunk0",
-        "source": "pubmed",
-        "title": "A multi-omics recovery factor predicts long COVID in the IMPACC study.",
-        "aff_hint": "National Institute of Allergy and Infectious Diseases",
-        "text": "Following SARS-CoV-2 infection, ~10-35% of COVID-19 patients experience long COVID (LC), in which debilitating symptoms persist for at least three months. Elucidating biologic underpinnings of LC could identify therapeutic opportunities. We utilized machine learning methods on biologic analytes provided over 12-months after hospital discharge from >500 COVID-19 patients in the IMPACC cohort to identify a multi-omics \"recovery factor\", trained on patient-reported physical function survey scores. Immune profiling data included PBMC transcriptomics, serum O-link and plasma proteomics, plasma metabolomics, and blood CyTOF protein levels."
-    }
+# Sample chunk from the corpus
+TEST_CHUNK = {
+    "doc_id": "pmid:40924481#chunk0",
+    "source": "pubmed",
+    "title": "A multi-omics recovery factor predicts long COVID in the IMPACC study.",
+    "aff_hint": "National Institute of Allergy and Infectious Diseases",
+    "text": "Following SARS-CoV-2 infection, ~10-35% of COVID-19 patients experience long COVID (LC), in which debilitating symptoms persist for at least three months. Elucidating biologic underpinnings of LC could identify therapeutic opportunities. We utilized machine learning methods on biologic analytes provided over 12-months after hospital discharge from >500 COVID-19 patients in the IMPACC cohort to identify a multi-omics \"recovery factor\", trained on patient-reported physical function survey scores. Immune profiling data included PBMC transcriptomics, serum O-link and plasma proteomics, plasma metabolomics, and blood CyTOF protein levels."
+}
+
+def _test_chunks(n: int):
+    """n distinct chunks of varying length derived from the sample chunk."""
+    sentences = TEST_CHUNK["text"].split(". ")
+    chunks = []
+    for i in range(n):
+        chunk = dict(TEST_CHUNK)
+        chunk["doc_id"] = f"pmid:40924481#chunk{i}"
+        chunk["text"] = ". ".join(sentences[:1 + i % len(sentences)]) + f" (sample {i})"
+        chunks.append(chunk)
+    return chunks
+
+def test_batch_extraction(n_chunks: int = 8, batch_size: int = 8, backend: str = "transformers"):
+    """Test batched extraction on a small list of chunks and report throughput."""
     
-    print("Loading model and tokenizer...")
+    print(f"Loading model and tokenizer ({backend})...")
     try:
-        model, tokenizer = load_model_and_tokenizer(debug=True)
+        if backend == "vllm":
+            model, tokenizer = load_vllm(debug=True)
+            batch_size = n_chunks  # one engine call for the whole list
+        else:
+            model, tokenizer = load_model_and_tokenizer(debug=True)
         print("Model loaded successfully!")
         
-        print("\nTesting extraction...")
-        result = extract_from_chunk(test_chunk, model, tokenizer)
+        chunks = _test_chunks(n_chunks)
+        print(f"\nTesting batched extraction on {len(chunks)} chunks (batch size {batch_size})...")
+        start = time.time()
+        results = extract_from_chunks(chunks, model, tokenizer, batch_size=batch_size)
+        elapsed = time.time() - start
         
-        print("\nExtraction result:")
-        print(json.dumps(result, indent=2))
-        
-        return result
+        print("\nFirst extraction result:")
+        print(json.dumps(results[0] if results else None, indent=2))
+        print(f"\n{len(results)}/{len(chunks)} chunks in {elapsed:.2f}s "
+              f"({len(chunks) / elapsed:.2f} chunks/s)")
         
+        return results
+    
     except Exception as e:
         print(f"Error: {e}")
         import traceback
@@ -42,4 +63,4 @@ def test_single_chunk():
         return None
 
 if __name__ == "__main__":
-    test_single_chunk()
+    test_batch_extraction(backend=sys.argv[1] if len(sys.argv) > 1 else "transformers")
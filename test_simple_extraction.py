@@ -4,19 +4,82 @@
 import json
 import re
 import sys
+from itertools import islice
 from pathlib import Path
 
+import pandas as pd
+
+try:
+    import hyperscan
+except ImportError:  # fall back to the stdlib alternation regexes
+    hyperscan = None
+
 # Add src to path
 sys.path.insert(0, str(Path(__file__).parent / "src"))
 
 from bslmap.io_utils import read_jsonl
 
+# BSL mention patterns, compiled once
+_BSL_PATTERNS = [
+    re.compile(r"bsl-?(\d+)"),
+    re.compile(r"biosafety level (\d+)"),
+    re.compile(r"containment level (\d+)"),
+]
+
+PATHOGEN_KEYWORDS = [
+    "ebola", "marburg", "nipah", "hendra", "sars", "mers", "covid",
+    "h5n1", "h7n9", "influenza", "anthrax", "smallpox", "variola",
+    "francisella", "yersinia pestis", "bacillus anthracis"
+]
+
+RESEARCH_KEYWORDS = [
+    "challenge study", "neutralization", "virus isolation", 
+    "reverse genetics", "vaccine", "antiviral", "therapeutic"
+]
+
+# One alternation per keyword list, so each list is found in a single scan.
+# The alternation sits in a zero-width lookahead: matches consume no text, so
+# overlapping keywords ("sarsmallpox") are all found. At most one keyword is
+# reported per start position, which is exact while none is a prefix of another.
+_PATHOGEN_RE = re.compile("(?=(%s))" % "|".join(map(re.escape, PATHOGEN_KEYWORDS)))
+_RESEARCH_RE = re.compile("(?=(%s))" % "|".join(map(re.escape, RESEARCH_KEYWORDS)))
+
+# With hyperscan, all keywords share one SIMD literal-matching database and
+# each chunk is scanned once; ids index into _KEYWORDS
+_KEYWORDS = PATHOGEN_KEYWORDS + RESEARCH_KEYWORDS
+if hyperscan is not None:
+    _KEYWORD_DB = hyperscan.Database()
+    _KEYWORD_DB.compile(
+        expressions=[re.escape(k).encode() for k in _KEYWORDS],
+        ids=list(range(len(_KEYWORDS))),
+        elements=len(_KEYWORDS),
+        flags=[hyperscan.HS_FLAG_SINGLEMATCH] * len(_KEYWORDS),
+    )
+
+def _find_keywords_regex(haystack):
+    """_find_keywords with the stdlib alternation regexes."""
+    found = {m.group(1) for m in _PATHOGEN_RE.finditer(haystack)}
+    found.update(m.group(1) for m in _RESEARCH_RE.finditer(haystack))
+    return found
+
+def _find_keywords(haystack):
+    """Set of pathogen and research keywords occurring in the haystack."""
+    if hyperscan is None:
+        return _find_keywords_regex(haystack)
+    
+    found = set()
+    def on_match(id, start, end, flags, context):
+        found.add(_KEYWORDS[id])
+    _KEYWORD_DB.scan(haystack.encode("utf-8"), match_event_handler=on_match)
+    return found
+
 def simple_rule_based_extraction(chunk):
     """Simple rule-based extraction as fallback."""
     result = {"doc_id": chunk.get("doc_id", "")}
     
     text = chunk.get("text", "").lower()
     title = chunk.get("title", "").lower()
+    haystack = text + " " + title
     aff_hint = chunk.get("aff_hint", "")
     
     # Extract PMID
@@ -30,49 +93,20 @@ def simple_rule_based_extraction(chunk):
         result["institution"] = aff_hint
     
     # Look for BSL mentions
-    bsl_patterns = [
-        r"bsl-?(\d+)",
-        r"biosafety level (\d+)",
-        r"containment level (\d+)"
-    ]
-    
-    for pattern in bsl_patterns:
-        matches = re.findall(pattern, text + " " + title)
-        if matches:
-            levels = [int(m) for m in matches if m.isdigit()]
-            if any(level >= 3 for level in levels):
-                max_level = max(levels)
-                result["bsl_level_inferred"] = f"BSL-{max_level}"
-                break
+    for pattern in _BSL_PATTERNS:
+        matches = pattern.findall(haystack)
+        # Groups are all digits; stop at the first pattern reaching BSL-3
+        max_level = max(map(int, matches), default=0)
+        if max_level >= 3:
+            result["bsl_level_inferred"] = f"BSL-{max_level}"
+            break
     else:
         result["bsl_level_inferred"] = "unknown"
     
-    # Look for common pathogens
-    pathogen_keywords = [
-        "ebola", "marburg", "nipah", "hendra", "sars", "mers", "covid",
-        "h5n1", "h7n9", "influenza", "anthrax", "smallpox", "variola",
-        "francisella", "yersinia pestis", "bacillus anthracis"
-    ]
-    
-    found_pathogens = []
-    for pathogen in pathogen_keywords:
-        if pathogen in text or pathogen in title:
-            found_pathogens.append(pathogen.title())
-    
-    result["pathogens"] = found_pathogens
-    
-    # Look for research types
-    research_keywords = [
-        "challenge study", "neutralization", "virus isolation", 
-        "reverse genetics", "vaccine", "antiviral", "therapeutic"
-    ]
-    
-    found_research = []
-    for research in research_keywords:
-        if research in text or research in title:
-            found_research.append(research)
-    
-    result["research_types"] = found_research
+    # Look for common pathogens and research types (reported in keyword-list order)
+    found = _find_keywords(haystack)
+    result["pathogens"] = [p.title() for p in PATHOGEN_KEYWORDS if p in found]
+    result["research_types"] = [r for r in RESEARCH_KEYWORDS if r in found]
     
     # Set defaults
     result["ppp_or_gof"] = False
@@ -81,6 +115,52 @@ def simple_rule_based_extraction(chunk):
     
     return result
 
+def rule_based_extraction_frame(chunks):
+    """
+    simple_rule_based_extraction over many chunks at once.
+    
+    The chunks are loaded into one DataFrame and matched with pandas'
+    vectorized string methods instead of a Python loop per chunk; results
+    are identical to calling simple_rule_based_extraction on each chunk.
+    """
+    columns = ["doc_id", "text", "title", "aff_hint"]
+    df = pd.DataFrame.from_records(list(chunks), columns=columns).fillna("")
+    haystack = df["text"].str.lower() + " " + df["title"].str.lower()
+    
+    pmids = df["doc_id"].str.extract(r"pmid:([^#]*)", expand=False)
+    
+    # First pattern (in _BSL_PATTERNS order) whose highest level is >= 3
+    bsl = pd.Series("unknown", index=df.index)
+    resolved = pd.Series(False, index=df.index)
+    for pattern in _BSL_PATTERNS:
+        matches = haystack.str.extractall(pattern)
+        if matches.empty:
+            continue
+        levels = matches[0].astype(int).groupby(level=0).max()
+        hit = levels[(levels >= 3) & ~resolved.loc[levels.index]]
+        bsl.loc[hit.index] = "BSL-" + hit.astype(str)
+        resolved.loc[hit.index] = True
+    
+    pathogen_hits = {p: haystack.str.contains(p, regex=False) for p in PATHOGEN_KEYWORDS}
+    research_hits = {r: haystack.str.contains(r, regex=False) for r in RESEARCH_KEYWORDS}
+    
+    results = []
+    for i, (doc_id, aff_hint, pmid) in enumerate(zip(df["doc_id"], df["aff_hint"], pmids)):
+        result = {"doc_id": doc_id}
+        if isinstance(pmid, str):
+            result["source_pmid"] = pmid
+        if aff_hint:
+            result["institution"] = aff_hint
+        result["bsl_level_inferred"] = bsl.iat[i]
+        result["pathogens"] = [p.title() for p, hits in pathogen_hits.items() if hits.iat[i]]
+        result["research_types"] = [r for r, hits in research_hits.items() if hits.iat[i]]
+        result["ppp_or_gof"] = False
+        result["confidence"] = 0.3  # Lower confidence for rule-based
+        result["evidence_spans"] = []
+        results.append(result)
+    
+    return results
+
 def test_simple_extraction():
     """Test simple extraction on a few chunks."""
     
@@ -90,15 +170,23 @@ def test_simple_extraction():
         print("Corpus file not found")
         return
     
-    chunks = list(read_jsonl(corpus_path))[:5]
+    chunks = list(islice(read_jsonl(corpus_path), 5))
     
     print(f"Testing simple extraction on {len(chunks)} chunks...")
     
-    for chunk in chunks:
-        result = simple_rule_based_extraction(chunk)
+    results = rule_based_extraction_frame(chunks)
+    assert results == [simple_rule_based_extraction(chunk) for chunk in chunks]
+    
+    for chunk, result in zip(chunks, results):
         print(f"\nChunk: {chunk['doc_id']}")
         print(f"Title: {chunk.get('title', '')[:100]}...")
         print(f"Result: {json.dumps(result, indent=2)}")
 
+def test_find_keywords_regex_overlaps():
+    """Overlapping keywords are all found on the regex path, as by substring tests."""
+    for haystack in ["sarsmallpox", "mersars", "ebolanthrax", "nipahendra vaccine"]:
+        expected = {k for k in _KEYWORDS if k in haystack}
+        assert _find_keywords_regex(haystack) == expected, haystack
+
 if __name__ == "__main__":
     test_simple_extraction()
@@ -0,0 +1,23 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from bslmap.consolidate_extractions import _build_institution_matcher, _match_institution
+
+LABS = {
+    "national institute of allergy and infectious diseases": {
+        "institution": "National Institute of Allergy and Infectious Diseases",
+    },
+    "boston university": {"institution": "Boston University"},
+}
+
+def _match(evidence: str) -> str:
+    match = _match_institution(evidence.lower(), _build_institution_matcher(LABS))
+    return match["institution"] if match else ""
+
+def test_full_name_beats_earlier_alias() -> None:
+    assert _match("NIH-funded work at the BSL-4 lab of Boston University") == "Boston University"
+
+def test_alias_not_matched_inside_word() -> None:
+    assert _match("Work annihilating Ebola at Boston University") == "Boston University"
@@ -0,0 +1,68 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "web" / "backend"))
+
+from fastapi.testclient import TestClient
+
+from app import data
+from app.main import app
+from app.routers import labs
+
+FEATURES = [
+    {
+        "type": "Feature",
+        "id": "lab0",
+        "properties": {
+            "bsl_level": "BSL-4",
+            "country": "USA",
+            "pathogens": ["Ebola"],
+            "research_types": ["vaccine"],
+        },
+        "geometry": {"type": "Point", "coordinates": [1.0, 2.0]},
+    },
+    {
+        "type": "Feature",
+        "id": "lab1",
+        "properties": {
+            "bsl_level": "BSL-3",
+            "country": None,
+            "pathogens": [None, "SARS", 3],
+            "research_types": None,
+        },
+        "geometry": {"type": "Point", "coordinates": [3.0, 4.0]},
+    },
+]
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    path = tmp_path / "labs.geojson"
+    path.write_text(json.dumps({"type": "FeatureCollection", "features": FEATURES}))
+    monkeypatch.setattr(data, "GEOJSON_PATH", path)
+    data._load_labs_file.cache_clear()
+    data._build_labs_index.cache_clear()
+    labs._LABS_BODY_CACHE.clear()
+    return TestClient(app)
+
+def test_null_valued_feature_does_not_break_endpoints(client) -> None:
+    all_labs = client.get("/api/labs")
+    assert all_labs.status_code == 200
+    assert [f["id"] for f in all_labs.json()["features"]] == ["lab0", "lab1"]
+
+    filtered = client.get("/api/labs", params={"country": "usa"})
+    assert [f["id"] for f in filtered.json()["features"]] == ["lab0"]
+
+    assert client.get("/api/labs/lab1").status_code == 200
+    assert client.get("/api/pathogens").json() == ["Ebola", "SARS"]
+    assert client.get("/api/research-types").json() == ["vaccine"]
+
+def test_labs_body_is_cached_per_etag_and_filters(client) -> None:
+    first = client.get("/api/labs", params={"country": "USA"})
+    assert list(labs._LABS_BODY_CACHE) == [(first.headers["etag"], None, "usa", None, None)]
+
+    second = client.get("/api/labs", params={"country": "usa"})
+    assert second.content == first.content
+    assert second.headers["content-type"] == "application/geo+json"
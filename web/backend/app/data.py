@@ -0,0 +1,98 @@
+import hashlib
+import mmap
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Set, Tuple
+
+import orjson
+
+# Paths - Go up 4 levels from current file to reach project root
+BASE_DIR = Path(__file__).parent.parent.parent.parent
+GEOJSON_PATH = BASE_DIR / 'data' / 'gold' / 'labs.geojson'
+
+@dataclass
+class LabsIndex:
+    """Inverted indices from filter value to positions in `features`."""
+    features: List[dict]
+    etag: str  # quoted ETag of the file contents
+    by_id: Dict[str, dict]
+    bsl_level: Dict[str, Set[int]]
+    country: Dict[str, Set[int]]  # lowercased
+    pathogen: Dict[str, Set[int]]  # lowercased
+    research_type: Dict[str, Set[int]]  # lowercased
+    pathogens: List[str]  # unique values as written, sorted
+    research_types: List[str]  # unique values as written, sorted
+
+@lru_cache(maxsize=1)
+def _load_labs_file(mtime_ns: int) -> Tuple[dict, str]:
+    # Parse and hash straight from a read-only memory map, without copying
+    # the file into a bytes object first
+    with open(GEOJSON_PATH, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            raw = f.read()
+            return orjson.loads(raw), f'"{hashlib.blake2b(raw, digest_size=16).hexdigest()}"'
+    with mm:
+        view = memoryview(mm)
+        try:
+            data = orjson.loads(view)
+            etag = f'"{hashlib.blake2b(view, digest_size=16).hexdigest()}"'
+        finally:
+            view.release()
+    return data, etag
+
+@lru_cache(maxsize=1)
+def _build_labs_index(mtime_ns: int) -> LabsIndex:
+    data, etag = _load_labs_file(mtime_ns)
+    features = data.get('features', [])
+    bsl_level = defaultdict(set)
+    country = defaultdict(set)
+    pathogen = defaultdict(set)
+    research_type = defaultdict(set)
+    pathogens = set()
+    research_types = set()
+
+    for i, feature in enumerate(features):
+        properties = feature.get('properties', {})
+        bsl_level[properties.get('bsl_level')].add(i)
+        # Null or non-string values are left out of the indices rather than
+        # failing every request
+        country[(properties.get('country') or '').lower()].add(i)
+        for p in properties.get('pathogens') or []:
+            if isinstance(p, str):
+                pathogen[p.lower()].add(i)
+                pathogens.add(p)
+        for r in properties.get('research_types') or []:
+            if isinstance(r, str):
+                research_type[r.lower()].add(i)
+                research_types.add(r)
+
+    return LabsIndex(
+        features=features,
+        etag=etag,
+        by_id={f['id']: f for f in reversed(features) if 'id' in f},  # first wins
+        bsl_level=dict(bsl_level),
+        country=dict(country),
+        pathogen=dict(pathogen),
+        research_type=dict(research_type),
+        pathogens=sorted(pathogens),
+        research_types=sorted(research_types),
+    )
+
+def load_labs_data() -> dict:
+    """
+    Return the parsed labs GeoJSON, parsing the file once per version.
+
+    The cache is keyed on the file's mtime, so a rebuilt labs.geojson is
+    picked up by the next request. Raises FileNotFoundError or
+    orjson.JSONDecodeError (a json.JSONDecodeError) if the file is missing
+    or invalid.
+    """
+    return _load_labs_file(GEOJSON_PATH.stat().st_mtime_ns)[0]
+
+def load_labs_index() -> LabsIndex:
+    """Return the filter indices for the current labs GeoJSON (see load_labs_data)."""
+    return _build_labs_index(GEOJSON_PATH.stat().st_mtime_ns)
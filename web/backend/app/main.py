@@ -1,7 +1,23 @@
-import json
+import logging
+import os
+from typing import Any
+
+import orjson
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from pathlib import Path
+from fastapi.responses import JSONResponse
+
+from app.data import load_labs_data
+
+# Log level for the app's own loggers, e.g. BSLMAP_LOG_LEVEL=DEBUG
+logging.basicConfig(level=os.environ.get("BSLMAP_LOG_LEVEL", "WARNING").upper())
+logger = logging.getLogger(__name__)
+
+class ORJSONResponse(JSONResponse):
+    """JSON response encoded with orjson instead of the stdlib json module."""
+    
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -10,7 +26,8 @@ app = FastAPI(
     version="0.1.0",
     docs_url="/api/docs",
     redoc_url="/api/redoc",
-    openapi_url="/api/openapi.json"
+    openapi_url="/api/openapi.json",
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -23,29 +40,16 @@ app.add_middleware(
     expose_headers=["Content-Disposition"],
 )
 
-# Paths
-BASE_DIR = Path(__file__).parent.parent.parent.parent
-GEOJSON_PATH = BASE_DIR / 'data' / 'gold' / 'labs.geojson'
-
-# Cache for lab data
-_labs_data = None
-
 def get_labs_data() -> dict:
-    """Load and cache the labs GeoJSON data."""
-    global _labs_data
-    
-    if _labs_data is None:
-        try:
-            with open(GEOJSON_PATH, 'r') as f:
-                _labs_data = json.load(f)
-        except Exception as e:
-            print(f"Error loading labs data: {e}")
-            _labs_data = {
-                "type": "FeatureCollection",
-                "features": []
-            }
-    
-    return _labs_data
+    """Load and cache the labs GeoJSON data (empty if it cannot be loaded)."""
+    try:
+        return load_labs_data()
+    except Exception as e:
+        logger.error("Error loading labs data: %s", e)
+        return {
+            "type": "FeatureCollection",
+            "features": []
+        }
 
 # Import routers
 from app.routers import labs
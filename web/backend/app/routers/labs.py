@@ -1,19 +1,87 @@
 import json
+import logging
+from collections import OrderedDict
 from enum import StrEnum
-from pathlib import Path
-from typing import Optional
+from typing import AsyncIterator, List, Optional, Tuple
 
-from fastapi import APIRouter, Query, HTTPException
+import orjson
+from fastapi import APIRouter, Query, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from geojson_pydantic import FeatureCollection
 from pydantic import BaseModel, Field
 
+from app.data import GEOJSON_PATH, LabsIndex, load_labs_index
+
 router = APIRouter()
 
-# Paths - Go up 3 levels from current file to reach project root
-BASE_DIR = Path(__file__).parent.parent.parent.parent.parent
-GEOJSON_PATH = BASE_DIR / 'data' / 'gold' / 'labs.geojson'
-print(f"Looking for GeoJSON file at: {GEOJSON_PATH}")
-print(f"File exists: {GEOJSON_PATH.exists()}")
+logger = logging.getLogger(__name__)
+
+def _not_modified(request: Request, etag: str) -> bool:
+    """True if the client's If-None-Match already names this ETag."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = {t.strip().removeprefix("W/") for t in header.split(",")}
+    return etag in tags or "*" in tags
+
+# Encoded /api/labs bodies and feature counts per (ETag, normalized filters),
+# least recently used first
+_LABS_BODY_CACHE: "OrderedDict[Tuple[Optional[str], ...], Tuple[bytes, int]]" = OrderedDict()
+LABS_BODY_CACHE_SIZE = 128
+
+# Encoded features are sent in chunks of about this many bytes
+STREAM_CHUNK_SIZE = 64 * 1024
+
+def _filter_features(
+    index: LabsIndex,
+    bsl_level: Optional[str],
+    country: Optional[str],
+    pathogen: Optional[str],
+    research_type: Optional[str]
+) -> List[dict]:
+    """Features of the index matching every given (normalized) filter, in file order."""
+    # Apply filters by intersecting the matching index entries
+    candidates = None
+    for lookup, value in (
+        (index.bsl_level, bsl_level),
+        (index.country, country),
+        (index.pathogen, pathogen),
+        (index.research_type, research_type),
+    ):
+        if value:
+            matches = lookup.get(value, set())
+            candidates = matches if candidates is None else candidates & matches
+    
+    if candidates is None:
+        return index.features
+    return [index.features[i] for i in sorted(candidates)]
+
+async def _stream_feature_collection(features: List[dict]) -> AsyncIterator[bytes]:
+    """Encode a FeatureCollection incrementally, one feature at a time."""
+    buf = bytearray(b'{"type":"FeatureCollection","features":[')
+    sep = b""
+    for feature in features:
+        buf += sep
+        buf += orjson.dumps(feature)
+        sep = b","
+        if len(buf) >= STREAM_CHUNK_SIZE:
+            yield bytes(buf)
+            buf.clear()
+    buf += b"]}"
+    yield bytes(buf)
+
+async def _stream_and_cache(
+    key: Tuple[Optional[str], ...],
+    features: List[dict]
+) -> AsyncIterator[bytes]:
+    """Stream the encoded features and keep the full body once it has been sent."""
+    chunks = []
+    async for chunk in _stream_feature_collection(features):
+        chunks.append(chunk)
+        yield chunk
+    _LABS_BODY_CACHE[key] = (b"".join(chunks), len(features))
+    while len(_LABS_BODY_CACHE) > LABS_BODY_CACHE_SIZE:
+        _LABS_BODY_CACHE.popitem(last=False)
 
 class BSLLevel(StrEnum):
     BSL2 = "BSL-2"
@@ -29,6 +97,7 @@ class LabFilters(BaseModel):
 
 @router.get("/labs")
 async def get_labs(
+    request: Request,
     bsl_level: Optional[str] = Query(None, description="Filter by BSL level"),
     country: Optional[str] = Query(None, description="Filter by country"),
     pathogen: Optional[str] = Query(None, description="Filter by pathogen"),
@@ -37,105 +106,98 @@ async def get_labs(
     """
     Get all labs with optional filtering.
     Returns GeoJSON FeatureCollection of lab locations and metadata.
-    """
-    print(f"Loading labs from: {GEOJSON_PATH}")
-    print(f"File exists: {GEOJSON_PATH.exists()}")
     
+    Every response carries the data file's ETag; the URL already includes
+    the filters, so a client revalidating with If-None-Match gets a 304
+    until labs.geojson changes.
+    """
     try:
-        with open(GEOJSON_PATH, 'r') as f:
-            data = json.load(f)
-        
-        print(f"Loaded {len(data.get('features', []))} labs")
-        
-        features = data.get('features', [])
+        index = load_labs_index()
+        if _not_modified(request, index.etag):
+            return Response(status_code=304, headers={"ETag": index.etag})
         
-        # Apply filters
-        filtered_features = []
-        for feature in features:
-            properties = feature.get('properties', {})
-            
-            # Skip if any filter doesn't match
-            if bsl_level and properties.get('bsl_level') != bsl_level:
-                continue
-            if country and properties.get('country', '').lower() != country.lower():
-                continue
-            if pathogen and not any(
-                p.lower() == pathogen.lower() 
-                for p in properties.get('pathogens', [])
-            ):
-                continue
-            if research_type and not any(
-                r.lower() == research_type.lower() 
-                for r in properties.get('research_types', [])
-            ):
-                continue
-                
-            filtered_features.append(feature)
-        
-        response = {
-            "type": "FeatureCollection",
-            "features": filtered_features
-        }
+        # Keyed on the data file's ETag, so a changed labs.geojson never
+        # serves old entries; they age out of the LRU
+        key = (
+            index.etag,
+            bsl_level or None,
+            country.lower() if country else None,
+            pathogen.lower() if pathogen else None,
+            research_type.lower() if research_type else None,
+        )
+        headers = {"ETag": index.etag}
+        cached = _LABS_BODY_CACHE.get(key)
+        if cached is not None:
+            _LABS_BODY_CACHE.move_to_end(key)
+            body, count = cached
+            logger.debug("Returning %d cached labs after filtering", count)
+            return Response(content=body, media_type="application/geo+json", headers=headers)
         
-        print(f"Returning {len(filtered_features)} labs after filtering")
-        return response
+        # First request for these filters: stream the body while encoding it
+        features = _filter_features(index, *key[1:])
+        logger.debug("Returning %d of %d labs after filtering", len(features), len(index.features))
+        return StreamingResponse(
+            _stream_and_cache(key, features),
+            media_type="application/geo+json",
+            headers=headers
+        )
         
     except json.JSONDecodeError as e:
-        print(f"JSON decode error: {str(e)}")
+        logger.error("JSON decode error in %s: %s", GEOJSON_PATH, e)
         raise HTTPException(
             status_code=500,
             detail=f"Error decoding JSON data: {str(e)}"
         )
     except FileNotFoundError:
-        print(f"File not found: {GEOJSON_PATH}")
+        logger.error("File not found: %s", GEOJSON_PATH)
         raise HTTPException(
             status_code=404,
             detail="Lab data file not found"
         )
     except Exception as e:
-        print(f"Unexpected error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Unexpected error loading lab data")
         raise HTTPException(
             status_code=500,
             detail=f"Error loading lab data: {str(e)}"
         )
 
 @router.get("/labs/{lab_id}")
-async def get_lab(lab_id: str):
+async def get_lab(lab_id: str, request: Request, response: Response):
     """
     Get detailed information about a specific lab by ID.
     """
     try:
-        with open(GEOJSON_PATH, 'r') as f:
-            data = json.load(f)
-        
-        for feature in data.get('features', []):
-            if feature.get('id') == lab_id:
-                return feature
-        
-        raise HTTPException(status_code=404, detail="Lab not found")
-        
+        index = load_labs_index()
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail="Lab data file not found"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error loading lab data: {str(e)}"
         )
+    
+    feature = index.by_id.get(lab_id)
+    if feature is None:
+        raise HTTPException(status_code=404, detail="Lab not found")
+    if _not_modified(request, index.etag):
+        return Response(status_code=304, headers={"ETag": index.etag})
+    response.headers["ETag"] = index.etag
+    return feature
 
 @router.get("/pathogens")
-async def get_pathogens():
+async def get_pathogens(request: Request, response: Response):
     """
     Get a list of all unique pathogens across all labs.
     """
     try:
-        with open(GEOJSON_PATH, 'r') as f:
-            data = json.load(f)
-        
-        pathogens = set()
-        for feature in data.get('features', []):
-            pathogens.update(feature.get('properties', {}).get('pathogens', []))
-        
-        return sorted(list(pathogens))
+        index = load_labs_index()
+        if _not_modified(request, index.etag):
+            return Response(status_code=304, headers={"ETag": index.etag})
+        response.headers["ETag"] = index.etag
+        return index.pathogens
         
     except Exception as e:
         raise HTTPException(
@@ -144,19 +206,16 @@ async def get_pathogens():
         )
 
 @router.get("/research-types")
-async def get_research_types():
+async def get_research_types(request: Request, response: Response):
     """
     Get a list of all unique research types across all labs.
     """
     try:
-        with open(GEOJSON_PATH, 'r') as f:
-            data = json.load(f)
-        
-        research_types = set()
-        for feature in data.get('features', []):
-            research_types.update(feature.get('properties', {}).get('research_types', []))
-        
-        return sorted(list(research_types))
+        index = load_labs_index()
+        if _not_modified(request, index.etag):
+            return Response(status_code=304, headers={"ETag": index.etag})
+        response.headers["ETag"] = index.etag
+        return index.research_types
         
     except Exception as e:
         raise HTTPException(